@@ -1,41 +1,26 @@
-import socket
-import threading
+from protohackers import Protocol, ServerOptions, TCPServer, Transport, log
 
 
-class Server:
+class EchoProtocol(Protocol):
+    def connection_made(self, transport: Transport) -> None:
+        log.info("Accepted connection from %s", transport.get_extra_info("peername"))
+
+    def data_received(self, data: bytes) -> None:
+        self.transport.write(data)
+
+    def eof_received(self) -> None:
+        log.info("Closing connection")
+        self.transport.close()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if isinstance(exc, TimeoutError):
+            log.info("Connection timed out")
+
+
+class Server(TCPServer):
     def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        while True:
-            conn, addr = self.sock.accept()
-            with self.print_lock:
-                print(f"Accepted Connection from {addr}")
-            thread = threading.Thread(target=self.process_connection, args=(conn,))
-            thread.start()
-
-    def process_connection(self, conn) -> None:
-        conn.settimeout(1)
-        try:
-            while True:
-                data = conn.recv(1024)
-                if not data:
-                    break
-                conn.sendall(data)
-            with self.print_lock:
-                print("Closing Connection...")
-        except socket.timeout:
-            with self.print_lock:
-                print("Connection timed out")
-        conn.close()
-
-    def close(self) -> None:
-        self.sock.close()
+        super().__init__(server, port, EchoProtocol, ServerOptions(idle_timeout=1))
+        log.info("Server listening on %s:%d", server, port)
 
 
 def main() -> None:
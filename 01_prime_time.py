@@ -1,7 +1,15 @@
-import socket
-import threading
 import json
 
+from protohackers import (
+    LineFramer,
+    LineTooLong,
+    Protocol,
+    ServerOptions,
+    TCPServer,
+    Transport,
+    log,
+)
+
 
 def is_prime(num: int | float) -> bool:
     if num < 2 or type(num) == float:
@@ -12,73 +20,63 @@ def is_prime(num: int | float) -> bool:
     return True
 
 
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        while True:
-            conn, addr = self.sock.accept()
-            with self.print_lock:
-                print(f"Accepted Connection from {addr}")
-            thread = threading.Thread(
-                target=self.process_connection, args=(conn,), daemon=True
-            )
-            thread.start()
+class PrimeTimeProtocol(Protocol):
+    def connection_made(self, transport: Transport) -> None:
+        self.framer = LineFramer()
+        log.info("Accepted connection from %s", transport.get_extra_info("peername"))
 
-    def process_connection(self, conn: socket.socket) -> None:
-        buffer = ""
+    def data_received(self, data: bytes) -> None:
+        self.framer.feed(data)
         try:
-            while True:
-                chunk: bytes = conn.recv(1024)
-                if not chunk:
-                    break
-                buffer += chunk.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
-                        continue
-                    good_request = self.handle_request(conn, line)
-                    if not good_request:
-                        conn.close()
-                        return
-        except (socket.timeout, ConnectionResetError, BrokenPipeError):
-            with self.print_lock:
-                print("Connection timed out")
-        finally:
-            conn.close()
+            for line in self.framer.lines():
+                if not line.strip():
+                    continue
+                with self.transport.metrics.timed("isPrime"):
+                    good_request = self.handle_request(line.decode(errors="replace"))
+                if not good_request:
+                    self.transport.close()
+                    return
+        except LineTooLong:
+            log.warning("Request too long")
+            self.transport.write(b"Malformed\n")
+            self.transport.close()
 
-    def handle_request(self, conn: socket.socket, line: str) -> bool:
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            log.info("Connection timed out")
+
+    def handle_request(self, line: str) -> bool:
         try:
             json_obj = json.loads(line)
         except json.decoder.JSONDecodeError:
-            with self.print_lock:
-                print(f"Malformed Json: {line}")
-            conn.sendall(b"Malformed\n")
+            log.warning("Malformed Json: %s", line)
+            self.transport.write(b"Malformed\n")
             return False
         try:
             assert json_obj["method"] == "isPrime"
             number = json_obj["number"]
             assert type(number) == int or type(number) == float
-        except (AssertionError, KeyError):
-            with self.print_lock:
-                print(f"Error in Json: {line}")
-            conn.sendall(b"Malformed\n")
+        except (AssertionError, KeyError, TypeError):
+            log.warning("Error in Json: %s", line)
+            self.transport.write(b"Malformed\n")
             return False
-        with self.print_lock:
-            print(f"Accepting {line}")
+        # Only a sample of good requests is logged, to keep logging off the hot path.
+        log.info("Accepting %s", line, sample=0.01)
         prime = is_prime(number)
         new_json = {"method": "isPrime", "prime": prime}
-        conn.sendall(json.dumps(new_json).encode() + b"\n")
+        self.transport.write(json.dumps(new_json).encode() + b"\n")
         return True
 
-    def close(self) -> None:
-        self.sock.close()
+
+class Server(TCPServer):
+    def __init__(self, server: str, port: int) -> None:
+        super().__init__(
+            server,
+            port,
+            PrimeTimeProtocol,
+            ServerOptions(idle_timeout=30, workers=4, evict_idle_after=5),
+        )
+        log.info("Server listening on %s:%d", server, port)
 
 
 def main() -> None:
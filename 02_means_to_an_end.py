@@ -1,7 +1,7 @@
-import socket
-import threading
-from dataclasses import dataclass
 import struct
+from dataclasses import dataclass
+
+from protohackers import Protocol, ServerOptions, TCPServer, Transport, log
 
 
 @dataclass
@@ -10,82 +10,48 @@ class PriceData:
     price: int
 
 
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        while True:
-            conn, addr = self.sock.accept()
-            with self.print_lock:
-                print(f"Accepted Connection from {addr}")
-            thread = threading.Thread(
-                target=self.process_connection, args=(conn,), daemon=True
-            )
-            thread.start()
-
-    def process_connection(self, conn: socket.socket) -> None:
-        conn.settimeout(30)
-        price_information: list[PriceData] = []
-        buffer = b""
-        try:
-            while True:
-                chunk: bytes = conn.recv(1024)
-                if not chunk:
-                    break
-                buffer += chunk
-                while len(buffer) >= 9:
-                    binary_message = buffer[:9]
-                    buffer = buffer[9:]
-                    completed = self.handle_message(
-                        conn, binary_message, price_information
-                    )
-                    if completed:
-                        break
-        except (socket.timeout, ConnectionResetError, BrokenPipeError):
-            with self.print_lock:
-                print("Connection timed out")
-        finally:
-            conn.close()
-
-    def handle_message(
-        self,
-        conn: socket.socket,
-        binary_message: bytes,
-        price_information: list[PriceData],
-    ) -> bool:
+class PriceProtocol(Protocol):
+    def connection_made(self, transport: Transport) -> None:
+        self.price_information: list[PriceData] = []
+        self.buffer = b""
+        log.info("Accepted connection from %s", transport.get_extra_info("peername"))
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= 9:
+            binary_message = self.buffer[:9]
+            self.buffer = self.buffer[9:]
+            completed = self.handle_message(binary_message)
+            if completed:
+                break
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            log.info("Connection timed out")
+
+    def handle_message(self, binary_message: bytes) -> bool:
+        metrics = self.transport.metrics
         if binary_message[:1] == b"I":
-            self.insert_message(binary_message, price_information)
+            with metrics.timed("insert"):
+                self.insert_message(binary_message)
             return False
         elif binary_message[:1] == b"Q":
-            self.query_message(binary_message, price_information, conn)
+            with metrics.timed("query"):
+                self.query_message(binary_message)
             return False
         else:
             return True
 
-    def insert_message(
-        self, binary_message: bytes, price_information: list[PriceData]
-    ) -> None:
-
+    def insert_message(self, binary_message: bytes) -> None:
         decoded_timestamp, decoded_price = struct.unpack(">ii", binary_message[1:9])
-        price_information.append(PriceData(decoded_timestamp, decoded_price))
-
-    def query_message(
-        self,
-        binary_message: bytes,
-        price_information: list[PriceData],
-        conn: socket.socket,
-    ):
+        self.price_information.append(PriceData(decoded_timestamp, decoded_price))
+
+    def query_message(self, binary_message: bytes) -> None:
         decoded_initial_timestamp, decoded_final_timestamp = struct.unpack(
             ">ii", binary_message[1:9]
         )
         prices: list[int] = []
-        for price_data in price_information:
+        for price_data in self.price_information:
             if (
                 decoded_initial_timestamp
                 <= price_data.timestamp
@@ -97,10 +63,15 @@ class Server:
         else:
             average_price = sum(prices) // len(prices)
             data_to_send = struct.pack(">i", average_price)
-        conn.sendall(data_to_send)
+        self.transport.write(data_to_send)
 
-    def close(self) -> None:
-        self.sock.close()
+
+class Server(TCPServer):
+    def __init__(self, server: str, port: int) -> None:
+        super().__init__(
+            server, port, PriceProtocol, ServerOptions(idle_timeout=30, workers=4)
+        )
+        log.info("Server listening on %s:%d", server, port)
 
 
 def main() -> None:
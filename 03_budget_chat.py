@@ -1,132 +1,94 @@
-import socket
-import threading
 from dataclasses import dataclass
-from time import sleep
+
+from protohackers import (
+    LineFramer,
+    LineTooLong,
+    Protocol,
+    ServerOptions,
+    TCPServer,
+    Transport,
+    log,
+)
 
 
 @dataclass
 class User:
     name: str
-    message_queue: list[str]
-    conn: socket.socket
-    conn_lock: threading.Lock
+    transport: Transport
 
 
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        self.users: list[User] = []
-        self.users_lock = threading.Lock()
-        worker_thread = threading.Thread(
-            target=self.process_message_queues, daemon=True
-        )
-        worker_thread.start()
-        while True:
-            conn, addr = self.sock.accept()
-            with self.print_lock:
-                print(f"Accepted Connection from {addr}")
-            thread = threading.Thread(
-                target=self.process_connection, args=(conn,), daemon=True
-            )
-            thread.start()
-
-    def process_message_queues(self) -> None:
-        while True:
-            sleep(0.1)
-            with self.users_lock:
-                for user in self.users:
-                    if not user.message_queue:
-                        continue
-                    for message in user.message_queue:
-                        self.send_message(user.conn, message, user.conn_lock)
-                    user.message_queue.clear()
-
-    def process_connection(self, conn: socket.socket) -> None:
-        conn.settimeout(30)
-        buffer = ""
-        joined_room = False
-        socket_lock = threading.Lock()
-        self.send_message(
-            conn, "Welcome to budgetchat! What shall I call you?", socket_lock
-        )
+class ChatProtocol(Protocol):
+    def __init__(self, server: "Server") -> None:
+        self.server = server
+        self.framer = LineFramer()
+        self.current_user: User | None = None
+
+    def connection_made(self, transport: Transport) -> None:
+        log.info("Accepted connection from %s", transport.get_extra_info("peername"))
+        self.send_message("Welcome to budgetchat! What shall I call you?")
+
+    def data_received(self, data: bytes) -> None:
+        self.framer.feed(data)
         try:
-            while True:
-                chunk: bytes = conn.recv(1024)
-                if not chunk:
-                    break
-                buffer += chunk.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    if not line.strip():
-                        break
-                    if joined_room == False:
-                        user_name = line
-                        if not user_name.isalnum():
-                            self.send_message(
-                                conn,
-                                "Your name must be alphanumeric. Disconnecting...",
-                                socket_lock,
-                            )
-                            return
-                        with self.users_lock:
-                            for user in self.users:
-                                if user.name == user_name:
-                                    continue
-                                user.message_queue.append(
-                                    f"* {user_name} has entered the room"
-                                )
-                        joining_message = f"* The room contains: {', '.join(user.name for user in self.users)}"
-                        self.send_message(conn, joining_message, socket_lock)
-                        current_user = User(user_name, [], conn, socket_lock)
-                        self.users.append(current_user)
-                        joined_room = True
-                        continue
-                    with self.users_lock:
-                        for user in self.users:
-                            if user.name == current_user.name:
-                                continue
-                            user.message_queue.append(f"[{user_name}] {line}")
-
-        except (socket.timeout, ConnectionResetError, BrokenPipeError) as e:
-            with self.print_lock:
-                print(f"Connection Error: {e}")
-
-        finally:
-            conn.close()
-            if not joined_room:
-                return
-            with self.users_lock:
-                self.users = [
-                    user for user in self.users if user.name != current_user.name
-                ]
-                for user in self.users:
-                    user.message_queue.append(
-                        f"* {current_user.name} has left the room"
+            for raw_line in self.framer.lines():
+                if self.transport.is_closing():
+                    return
+                line = raw_line.decode(errors="replace")
+                if not line.strip():
+                    continue
+                if self.current_user is None:
+                    with self.transport.metrics.timed("join"):
+                        self.join_room(line)
+                    continue
+                with self.transport.metrics.timed("message"):
+                    self.server.broadcast(
+                        f"[{self.current_user.name}] {line}", self.current_user
                     )
+        except LineTooLong:
+            self.send_message("Your message is too long. Disconnecting...")
+            self.transport.close()
 
-    def send_message(
-        self, conn: socket.socket, message: str, socket_lock: threading.Lock
-    ) -> None:
-        try:
-            with socket_lock:
-                conn.sendall(message.encode() + b"\n")
-        except (socket.timeout, ConnectionResetError, BrokenPipeError):
-            with self.print_lock:
-                print("Send failure: {e}")
+    def join_room(self, user_name: str) -> None:
+        if not user_name.isalnum():
+            self.send_message("Your name must be alphanumeric. Disconnecting...")
+            self.transport.close()
+            return
+        users = self.server.users
+        for user in users:
+            if user.name == user_name:
+                continue
+            user.transport.write(f"* {user_name} has entered the room\n".encode())
+        joining_message = f"* The room contains: {', '.join(user.name for user in users)}"
+        self.send_message(joining_message)
+        self.current_user = User(user_name, self.transport)
+        users.append(self.current_user)
 
-    def close(self) -> None:
-        try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-        except OSError:
-            pass
-        self.sock.close()
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            log.warning("Connection error: %s", exc)
+        if self.current_user is None:
+            return
+        self.server.users.remove(self.current_user)
+        self.server.broadcast(f"* {self.current_user.name} has left the room")
+
+    def send_message(self, message: str) -> None:
+        self.transport.write(message.encode() + b"\n")
+
+
+class Server(TCPServer):
+    def __init__(self, server: str, port: int) -> None:
+        super().__init__(
+            server, port, lambda: ChatProtocol(self), ServerOptions(idle_timeout=30)
+        )
+        self.users: list[User] = []
+        log.info("Server listening on %s:%d", server, port)
+
+    def broadcast(self, message: str, sender: User | None = None) -> None:
+        encoded = message.encode() + b"\n"
+        for user in self.users:
+            if sender is not None and user.name == sender.name:
+                continue
+            user.transport.write(encoded)
 
 
 def main() -> None:
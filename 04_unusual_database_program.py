@@ -1,36 +1,38 @@
-import socket
+from typing import Any
 
+from protohackers import DatagramProtocol, DatagramTransport, UDPServer, log
 
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket(type=socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        print(f"Server listening on {server}:{port}")
 
-    def handle_connections(self) -> None:
+class DatabaseProtocol(DatagramProtocol):
+    def __init__(self) -> None:
         self.database: dict[str, str] = {"version": "Unusual Database v1.0"}
-        while True:
-            message, conn_info = self.sock.recvfrom(1024)
-            message = message.decode()
-            if "=" in message:
-                key, value = message.split("=", maxsplit=1)
-                if key == "version":
-                    continue
-                else:
-                    self.database[key] = value
-            else:
-                if message not in self.database:
-                    continue
-                response = f"{message}={self.database[message]}".encode()
-                self.sock.sendto(response, conn_info)
-
-    def close(self) -> None:
-        try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-        except OSError:
-            pass
-        self.sock.close()
+
+    def connection_made(self, transport: DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        message = data.decode()
+        kind = "insert" if "=" in message else "query"
+        with self.transport.metrics.timed(kind):
+            self.handle_message(message, addr)
+
+    def handle_message(self, message: str, addr: Any) -> None:
+        if "=" in message:
+            key, value = message.split("=", maxsplit=1)
+            if key == "version":
+                return
+            self.database[key] = value
+        else:
+            if message not in self.database:
+                return
+            response = f"{message}={self.database[message]}".encode()
+            self.transport.sendto(response, addr)
+
+
+class Server(UDPServer):
+    def __init__(self, server: str, port: int) -> None:
+        super().__init__(server, port, DatabaseProtocol())
+        log.info("Server listening on %s:%d", server, port)
 
 
 def main() -> None:
@@ -1,116 +1,75 @@
-import socket
-import threading
 import re
+import socket
 
+from protohackers import (
+    LineFramer,
+    LineTooLong,
+    Protocol,
+    ServerOptions,
+    TCPServer,
+    Transport,
+    log,
+)
 
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        while True:
-            conn, addr = self.sock.accept()
-            with self.print_lock:
-                print(f"Accepted Connection from {addr}")
-            thread = threading.Thread(
-                target=self.process_connection, args=(conn,), daemon=True
-            )
-            thread.start()
-
-    def process_connection(self, conn: socket.socket) -> None:
-        conn.settimeout(30)
-        buffer = ""
-        upstream_conn = socket.socket()
-        upstream_conn.connect(("chat.protohackers.com", 16963))
-        upstream_connection_thread = threading.Thread(
-            target=self.process_upstream_connection,
-            args=(upstream_conn, conn),
-            daemon=True,
-        )
-        upstream_connection_thread.start()
-        try:
-            while True:
-                try:
-                    chunk: bytes = conn.recv(1024)
-                except OSError as e:
-                    break
-                if not chunk:
-                    break
-                buffer += chunk.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    self.send_message(upstream_conn, line)
-        except (socket.timeout, ConnectionResetError, BrokenPipeError) as e:
-            with self.print_lock:
-                print(f"Connection Error: {e}")
-        finally:
-            try:
-                conn.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            try:
-                upstream_conn.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            conn.close()
-            upstream_conn.close()
-
-    def process_upstream_connection(
-        self, upstream_conn: socket.socket, client_conn: socket.socket
-    ) -> None:
-        buffer = ""
-        upstream_conn.settimeout(30)
+UPSTREAM = ("chat.protohackers.com", 16963)
+
+
+class RelayProtocol(Protocol):
+    """Relays lines from this connection to its peer, rewriting addresses."""
+
+    def __init__(self, peer: "RelayProtocol | None" = None) -> None:
+        self.peer = peer
+        self.framer = LineFramer()
+
+    def data_received(self, data: bytes) -> None:
+        self.framer.feed(data)
         try:
-            while True:
-                try:
-                    chunk: bytes = upstream_conn.recv(1024)
-                except OSError as e:
-                    break
-                if not chunk:
-                    break
-                buffer += chunk.decode()
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    self.send_message(client_conn, line)
-        except (socket.timeout, ConnectionResetError, BrokenPipeError) as e:
-            with self.print_lock:
-                print(f"Connection Error: {e}")
-        finally:
-            try:
-                upstream_conn.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            try:
-                client_conn.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            upstream_conn.close()
-            client_conn.close()
+            for line in self.framer.lines():
+                # surrogateescape passes bytes that are not UTF-8 through as is.
+                with self.transport.metrics.timed("relay"):
+                    self.peer.send_message(line.decode(errors="surrogateescape"))
+        except LineTooLong:
+            self.transport.close()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            log.warning("Connection error: %s", exc)
+        self.peer.transport.close()
 
     @staticmethod
     def rewrite_boguscoin_addresses(message: str) -> str:
         boguscoin_pattern = re.compile(r"(?:(?<=^)|(?<= ))(7[a-zA-Z0-9]{25,34})(?= |$)")
         return re.sub(boguscoin_pattern, "7YWHMfk9JZe0LM0g1ZauHuiSxhI", message)
 
-    def send_message(self, conn: socket.socket, message: str) -> None:
+    def send_message(self, message: str) -> None:
         modified_message = self.rewrite_boguscoin_addresses(message)
-        try:
-            conn.sendall(modified_message.encode() + b"\n")
-        except (socket.timeout, ConnectionResetError, BrokenPipeError, OSError) as e:
-            with self.print_lock:
-                print(f"Send failure: {e}")
+        self.transport.write(
+            modified_message.encode(errors="surrogateescape") + b"\n"
+        )
 
-    def close(self) -> None:
-        try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-        except OSError:
-            pass
-        self.sock.close()
+
+class ClientProtocol(RelayProtocol):
+    def __init__(self, server: "Server") -> None:
+        super().__init__()
+        self.server = server
+
+    def connection_made(self, transport: Transport) -> None:
+        log.info("Accepted connection from %s", transport.get_extra_info("peername"))
+        self.peer = RelayProtocol(self)
+        self.server.create_connection(self.server.upstream, self.peer)
+
+
+class Server(TCPServer):
+    def __init__(
+        self, server: str, port: int, upstream: tuple[str, int] = UPSTREAM
+    ) -> None:
+        super().__init__(
+            server, port, lambda: ClientProtocol(self), ServerOptions(idle_timeout=30)
+        )
+        # Resolve once up front so connecting upstream never blocks the loop.
+        upstream_host, upstream_port = upstream
+        self.upstream = (socket.gethostbyname(upstream_host), upstream_port)
+        log.info("Server listening on %s:%d", server, port)
 
 
 def main() -> None:
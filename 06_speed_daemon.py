@@ -1,12 +1,47 @@
-import socket
-import threading
-import time
-from dataclasses import dataclass
-from enum import IntEnum
-from queue import Queue, Empty
+import argparse
+import sys
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
 
+from protohackers import (
+    Protocol,
+    ServerOptions,
+    TCPServer,
+    TimerHandle,
+    Transport,
+    log,
+)
+from speed_daemon_codec import (
+    BAD_MESSAGE_FRAME,
+    HEARTBEAT_FRAME,
+    Decoder,
+    MessageType,
+    ProtocolError,
+    encode_ticket,
+)
+from speed_daemon_journal import Journal, TicketRecord, is_ticketed
 
-@dataclass
+
+SECONDS_PER_DAY = 86400
+
+# Observations beyond the retention horizon are dropped an hour's worth at a
+# time, so dropping them never holds up the loop for long.
+SECONDS_PER_EXPIRY = 3600
+
+# How many plate observations to accept between checks for a due snapshot.
+SNAPSHOT_CHECK_INTERVAL = 10_000
+
+# How many journal records may accumulate before a snapshot is written.
+SNAPSHOT_INTERVAL = 1_000_000
+
+# Seconds a client may sit idle before saying whether it is a camera or a
+# dispatcher. Once it has, it may stay quiet for as long as it likes, since
+# a dispatcher has nothing to send and cameras may see no traffic.
+IDENTIFY_TIMEOUT = 10
+
+
+@dataclass(slots=True)
 class Plate:
     plate: str
     timestamp: int
@@ -24,6 +59,18 @@ class Ticket:
     timestamp2: int
     speed: int
 
+    def as_record(self) -> TicketRecord:
+        # Spelled out, as dataclasses.astuple deep-copies field by field.
+        return (
+            self.plate,
+            self.road,
+            self.mile1,
+            self.timestamp1,
+            self.mile2,
+            self.timestamp2,
+            self.speed,
+        )
+
 
 @dataclass
 class Client:
@@ -40,186 +87,323 @@ class Camera(Client):
 @dataclass
 class Dispatcher(Client):
     roads: list[int]
-    conn: socket.socket
-    connection_lock: threading.Lock
-
-
-class MessageType(IntEnum):
-    ERROR = 0x10
-    PLATE = 0x20
-    TICKET = 0x21
-    WANTHEARTBEAT = 0x40
-    HEARTBEAT = 0x41
-    IAMCAMERA = 0x80
-    IAMDISPATCHER = 0x81
-
-
-class Server:
-    def __init__(self, server: str, port: int) -> None:
-        self.sock = socket.socket()
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((server, port))
-        self.sock.listen()
-        self.print_lock = threading.Lock()
-        print(f"Server listening on {server}:{port}")
-
-    def handle_connections(self) -> None:
-        self.plates: list[Plate] = []
-        self.plates_lock = threading.Lock()
-        self.dispatchers: list[Dispatcher] = []
-        self.dispatchers_lock = threading.Lock()
-        self.ticket_queue: Queue[Ticket] = Queue()
-        tickets_thread = threading.Thread(
-            target=self.process_ticket_queue, args=(), daemon=True
-        )
-        tickets_thread.start()
-        while True:
-            conn, _ = self.sock.accept()
-            thread = threading.Thread(
-                target=self.process_connection, args=(conn,), daemon=True
-            )
-            thread.start()
+    transport: Transport
+    # Tickets written to the transport but not yet sent, each with how many
+    # bytes the transport must have sent for it to have gone out.
+    unsent: deque[tuple[int, Ticket]] = field(default_factory=deque)
 
-    def process_connection(self, conn: socket.socket) -> None:
-        buffer = b""
-        connection_lock = threading.Lock()
-        client = Client(0)
-        done = False
+
+class SpeedDaemonProtocol(Protocol):
+    def __init__(self, server: "Server") -> None:
+        self.server = server
+        self.decoder = Decoder()
+        self.client = Client(0)
+        self.heartbeat_interval = 0.0
+        self.next_heartbeat = 0.0
+        self.heartbeat_timer: TimerHandle | None = None
+
+    def data_received(self, data: bytes) -> None:
+        self.decoder.feed(data)
         try:
-            while True:
-                try:
-                    chunk: bytes = conn.recv(1024)
-                except OSError as e:
-                    break
-                if not chunk:
-                    done = True
-                buffer += chunk
-                try:
-                    while buffer:
-                        message_type = buffer[0]
-                        if message_type == MessageType.PLATE:
-                            if not isinstance(client, Camera):
-                                self.send_error(conn, connection_lock)
-                                done = True
-                                break
-                            plate_bytes_len = 6 + buffer[1]
-                            if plate_bytes_len > len(buffer):
-                                break
-                            plate_bytes = buffer[:plate_bytes_len]
-                            plate = self.process_plate(plate_bytes, client)
-                            buffer = buffer[plate_bytes_len:]
-                            self.check_for_ticket(plate, client.limit)
-                        elif message_type == MessageType.WANTHEARTBEAT:
-                            if client.heartbeat != 0:
-                                self.send_error(conn, connection_lock)
-                                done = True
-                                break
-                            else:
-                                heartbeat_bytes_len = 5
-                                if heartbeat_bytes_len > len(buffer):
-                                    break
-                                heartbeat_bytes = buffer[:heartbeat_bytes_len]
-                                client.heartbeat = int.from_bytes(
-                                    heartbeat_bytes[1:5], "big"
-                                )
-                                heartbeat_thread = threading.Thread(
-                                    target=self.process_heartbeat,
-                                    args=(conn, connection_lock, heartbeat_bytes),
-                                    daemon=True,
-                                )
-                                heartbeat_thread.start()
-                                buffer = buffer[heartbeat_bytes_len:]
-                        elif message_type == MessageType.IAMCAMERA:
-                            if isinstance(client, (Camera, Dispatcher)):
-                                self.send_error(conn, connection_lock)
-                                done = True
-                                break
-                            camera_bytes_len = 7
-                            if camera_bytes_len > len(buffer):
-                                break
-                            camera_bytes = buffer[:camera_bytes_len]
-                            client = self.process_camera(camera_bytes)
-                            buffer = buffer[camera_bytes_len:]
-                        elif message_type == MessageType.IAMDISPATCHER:
-                            if isinstance(client, (Camera, Dispatcher)):
-                                self.send_error(conn, connection_lock)
-                                done = True
-                                break
-                            dispatcher_bytes_len = 2 + (buffer[1] * 2)
-                            if dispatcher_bytes_len > len(buffer):
-                                break
-                            dispatcher_bytes = buffer[:dispatcher_bytes_len]
-                            client = self.process_dispatcher(
-                                dispatcher_bytes, conn, connection_lock
-                            )
-                            buffer = buffer[dispatcher_bytes_len:]
-                        else:
-                            self.send_error(conn, connection_lock)
-                            done = True
-                            break
-                    if done:
-                        break
-                except IndexError:
-                    continue
-                except UnicodeError:
-                    self.send_error(conn, connection_lock)
-                    break
-        except (ConnectionResetError, BrokenPipeError, OSError) as e:
-            with self.print_lock:
-                print(f"Process Connection Send Error: {e}")
-        finally:
-            with self.dispatchers_lock:
-                self.dispatchers = [
-                    dispatcher
-                    for dispatcher in self.dispatchers
-                    if dispatcher.conn is not conn
-                ]
-            try:
-                conn.shutdown(socket.SHUT_RDWR)
-            except Exception:
-                pass
-            conn.close()
-
-    def send_error(self, conn: socket.socket, connection_lock: threading.Lock) -> None:
-        error_message = "Bad Message"
-        with connection_lock:
-            conn.sendall(
-                MessageType.ERROR.to_bytes(1, "big")
-                + len(error_message).to_bytes(1, "big")
-                + error_message.encode()
-            )
+            good_messages = self.process_messages()
+        except (ProtocolError, UnicodeError):
+            good_messages = False
+        if not good_messages:
+            self.send_error()
+            self.transport.close()
+
+    def process_messages(self) -> bool:
+        """Handle every complete message in the decoder.
+
+        Returns False if the client sent a message it is not allowed to send.
+        """
+        metrics = self.transport.metrics
+        while (message := self.decoder.next_message()) is not None:
+            message_type, fields = message
+            client = self.client
+            if message_type == MessageType.PLATE:
+                if not isinstance(client, Camera):
+                    return False
+                with metrics.timed("plate"):
+                    plate = self.server.process_plate(*fields, client)
+                    if plate is not None:
+                        self.server.check_for_ticket(plate, client.limit)
+            elif message_type == MessageType.WANTHEARTBEAT:
+                if client.heartbeat != 0:
+                    return False
+                client.heartbeat = fields
+                self.process_heartbeat(fields)
+            elif message_type == MessageType.IAMCAMERA:
+                if isinstance(client, (Camera, Dispatcher)):
+                    return False
+                self.client = self.server.process_camera(*fields)
+                self.transport.set_idle_timeout(None)
+            elif message_type == MessageType.IAMDISPATCHER:
+                if isinstance(client, (Camera, Dispatcher)):
+                    return False
+                with metrics.timed("dispatcher"):
+                    self.client = self.server.process_dispatcher(
+                        fields, self.transport
+                    )
+                self.transport.set_idle_timeout(None)
+            else:
+                return False
+        return True
+
+    def data_sent(self) -> None:
+        if isinstance(self.client, Dispatcher):
+            self.server.record_sent_tickets(self.client)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        if exc is not None:
+            log.warning("Connection error: %s", exc)
+        if self.heartbeat_timer is not None:
+            self.heartbeat_timer.cancel()
+        if isinstance(self.client, Dispatcher):
+            self.server.remove_dispatcher(self.client)
+
+    def send_error(self) -> None:
+        self.transport.write(BAD_MESSAGE_FRAME)
+
+    def process_heartbeat(self, deciseconds: int) -> None:
+        interval = deciseconds / 10
+        if interval == 0:
+            return
+        loop = self.transport.loop
+        self.heartbeat_interval = interval
+        self.next_heartbeat = loop.time() + interval
+        self.heartbeat_timer = loop.call_at(self.next_heartbeat, self.send_heartbeat)
+
+    def send_heartbeat(self) -> None:
+        if self.transport.is_closing():
+            return
+        # A client that stops reading must not have heartbeats pile up for it.
+        if not self.transport.get_write_buffer_size():
+            self.transport.write(HEARTBEAT_FRAME)
+        loop = self.transport.loop
+        self.next_heartbeat = max(
+            self.next_heartbeat + self.heartbeat_interval, loop.time()
+        )
+        self.heartbeat_timer = loop.call_at(self.next_heartbeat, self.send_heartbeat)
+
+
+class Server(TCPServer):
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        retention_horizon: int | None = None,
+        journal_dir: str | None = None,
+    ) -> None:
+        super().__init__(
+            server,
+            port,
+            lambda: SpeedDaemonProtocol(self),
+            # Identified clients may stay connected and quiet indefinitely,
+            # so neither a connection limit nor idle eviction fits them.
+            ServerOptions(
+                nodelay=True, idle_timeout=IDENTIFY_TIMEOUT, max_connections=None
+            ),
+        )
+        # Observations more than retention_horizon seconds older than the
+        # newest one seen are refused, and those held are dropped an hour at a
+        # time once all of the hour is that old. None keeps them for as long
+        # as they could still produce a ticket.
+        self.retention_horizon = retention_horizon
+        self.journal = Journal(journal_dir) if journal_dir is not None else None
+        # Observations by plate, then road.
+        self.plates: dict[str, dict[int, list[Plate]]] = {}
+        self.ticket_history: dict[str, set[int]] = {}
+        # Days plates have tickets for that are written to a dispatcher but
+        # not yet sent. They count as ticketed, but only reach the ticket
+        # history and the journal once sent.
+        self.unsent_ticket_days: dict[str, set[int]] = {}
+        # With a retention horizon, the plates observed in each hour and
+        # ticketed on each day, so expiring them only touches what they hold.
+        self.plates_by_hour: dict[int, set[str]] = {}
+        self.ticketed_by_day: dict[int, set[str]] = {}
+        self.expired_before_hour = 0
+        self.expired_before_day = 0
+        self.latest_timestamp = 0
+        self.plates_since_snapshot_check = 0
+        self.dispatchers: dict[int, list[Dispatcher]] = {}
+        # Tickets waiting for a dispatcher for their road to connect.
+        self.pending_tickets: dict[int, list[Ticket]] = {}
+        if self.journal is not None:
+            self.recover_state()
+        log.info("Server listening on %s:%d", server, port)
 
-    def process_plate(self, buffer: bytes, client: Camera) -> Plate:
-        plate_length = buffer[1]
-        plate_end = 2 + plate_length
-        plate = buffer[2:plate_end].decode("ascii")
-        timestamp = int.from_bytes(buffer[plate_end : plate_end + 4], "big")
-        plate = Plate(plate, timestamp, client.road, client.mile)
-        with self.plates_lock:
-            self.plates.append(plate)
+    def recover_state(self) -> None:
+        observations, tickets, ticketed = self.journal.recover()
+        for plate, timestamp, road, mile in observations:
+            self.store_plate(Plate(sys.intern(plate), timestamp, road, mile))
+            self.latest_timestamp = max(self.latest_timestamp, timestamp)
+        for plate, day in ticketed:
+            self.record_ticketed(sys.intern(plate), day)
+        if self.retention_horizon is not None:
+            self.expire()
+        undelivered = 0
+        for ticket in tickets:
+            if not is_ticketed(ticket, self.ticket_history):
+                self.dispatch_ticket(Ticket(sys.intern(ticket[0]), *ticket[1:]))
+                undelivered += 1
+        log.info(
+            "Recovered %d observations and %d undelivered tickets",
+            len(observations),
+            undelivered,
+        )
+
+    def process_plate(
+        self, plate: str, timestamp: int, client: Camera
+    ) -> Plate | None:
+        """Store an observation, or return None if it is beyond the horizon.
+
+        Days beyond the retention horizon drop out of the ticket history, so
+        an observation from one of them could ticket a car twice in a day.
+        """
+        if timestamp > self.latest_timestamp:
+            self.latest_timestamp = timestamp
+            if (
+                self.retention_horizon is not None
+                and (timestamp - self.retention_horizon) // SECONDS_PER_EXPIRY
+                > self.expired_before_hour
+            ):
+                self.expire()
+        elif (
+            self.retention_horizon is not None
+            and timestamp < self.latest_timestamp - self.retention_horizon
+        ):
+            return None
+        plate = Plate(sys.intern(plate), timestamp, client.road, client.mile)
+        self.store_plate(plate)
+        if self.journal is not None:
+            self.journal.append_plate(plate.plate, timestamp, plate.road, plate.mile)
+            self.plates_since_snapshot_check += 1
+            if self.plates_since_snapshot_check >= SNAPSHOT_CHECK_INTERVAL:
+                self.plates_since_snapshot_check = 0
+                if self.journal.records_since_snapshot >= SNAPSHOT_INTERVAL:
+                    self.start_snapshot()
         return plate
 
-    def check_for_ticket(self, plate_to_check: Plate, speed_limit: int) -> None:
-        with self.plates_lock:
-            for plate in self.plates:
-                if not (
-                    plate.road == plate_to_check.road
-                    and plate.plate == plate_to_check.plate
-                    and plate.mile != plate_to_check.mile
-                ):
-                    continue
-                plate1, plate2 = (
-                    (plate, plate_to_check)
-                    if plate_to_check.timestamp > plate.timestamp
-                    else (plate_to_check, plate)
+    def store_plate(self, plate: Plate) -> None:
+        roads = self.plates.get(plate.plate)
+        if roads is None:
+            roads = self.plates[plate.plate] = {}
+        observations = roads.get(plate.road)
+        hour = plate.timestamp // SECONDS_PER_EXPIRY
+        if observations is None:
+            roads[plate.road] = [plate]
+        else:
+            observations.append(plate)
+            # Any observation from the same hour has already filed the plate
+            # under it.
+            if observations[-2].timestamp // SECONDS_PER_EXPIRY == hour:
+                return
+        if self.retention_horizon is not None:
+            self.plates_by_hour.setdefault(hour, set()).add(plate.plate)
+
+    def drop_plates(self, plate: str, keep: Callable[[Plate], bool]) -> None:
+        """Drop the observations of plate that keep returns False for."""
+        roads = self.plates.get(plate)
+        if roads is None:
+            return
+        for road, observations in list(roads.items()):
+            # A new list, as check_for_ticket may be iterating over the old one.
+            observations = [
+                observation for observation in observations if keep(observation)
+            ]
+            if observations:
+                roads[road] = observations
+            else:
+                del roads[road]
+        if not roads:
+            del self.plates[plate]
+
+    def start_snapshot(self) -> None:
+        """Hand the journal a copy of the current state to snapshot.
+
+        Only references to the observations are copied here, since they are
+        never changed once made; the journal thread reads their fields while
+        it writes the snapshot.
+        """
+        observations = [
+            observation
+            for roads in self.plates.values()
+            for observations in roads.values()
+            for observation in observations
+        ]
+        self.journal.start_snapshot(
+            (
+                (plate.plate, plate.timestamp, plate.road, plate.mile)
+                for plate in observations
+            ),
+            {plate: set(days) for plate, days in self.ticket_history.items()},
+        )
+
+    def expire(self) -> None:
+        """Drop what has passed beyond the retention horizon since last time.
+
+        Observations go an hour at a time, once all of the hour is beyond the
+        horizon. Days wholly beyond it can no longer be ticketed on, so their
+        ticketed days go too, and so do held tickets from them, which could
+        otherwise repeat one already sent.
+        """
+        cutoff = self.latest_timestamp - self.retention_horizon
+        first_hour = cutoff // SECONDS_PER_EXPIRY
+        first_timestamp = first_hour * SECONDS_PER_EXPIRY
+        self.expired_before_hour = first_hour
+        for hour in [hour for hour in self.plates_by_hour if hour < first_hour]:
+            for plate in self.plates_by_hour.pop(hour):
+                self.drop_plates(
+                    plate, lambda observation: observation.timestamp >= first_timestamp
                 )
-                distance = abs(plate2.mile - plate1.mile)
-                time = plate2.timestamp - plate1.timestamp
-                if time <= 0:
+        first_day = cutoff // SECONDS_PER_DAY
+        if first_day <= self.expired_before_day:
+            return
+        self.expired_before_day = first_day
+        for day in [day for day in self.ticketed_by_day if day < first_day]:
+            for plate in self.ticketed_by_day.pop(day):
+                days = self.ticket_history.get(plate)
+                if days is None:
                     continue
-                speed_100 = (distance * 3_600 * 100 + time // 2) // time
-                if speed_100 >= speed_limit * 100 + 50:
-                    self.issue_ticket(plate1, plate2, speed_100)
+                days.discard(day)
+                if not days:
+                    del self.ticket_history[plate]
+        for road in list(self.pending_tickets):
+            tickets = [
+                ticket
+                for ticket in self.pending_tickets[road]
+                if ticket.timestamp1 // SECONDS_PER_DAY >= first_day
+            ]
+            if tickets:
+                self.pending_tickets[road] = tickets
+            else:
+                del self.pending_tickets[road]
+
+    def first_retained_day(self) -> int | None:
+        """The first day kept in the ticket history, or None if all are kept."""
+        if self.retention_horizon is None:
+            return None
+        return (self.latest_timestamp - self.retention_horizon) // SECONDS_PER_DAY
+
+    def check_for_ticket(self, plate_to_check: Plate, speed_limit: int) -> None:
+        roads = self.plates.get(plate_to_check.plate)
+        observations = roads.get(plate_to_check.road) if roads is not None else None
+        for plate in observations or ():
+            if plate.mile == plate_to_check.mile:
+                continue
+            plate1, plate2 = (
+                (plate, plate_to_check)
+                if plate_to_check.timestamp > plate.timestamp
+                else (plate_to_check, plate)
+            )
+            distance = abs(plate2.mile - plate1.mile)
+            time = plate2.timestamp - plate1.timestamp
+            if time <= 0:
+                continue
+            speed_100 = (distance * 3_600 * 100 + time // 2) // time
+            if speed_100 >= speed_limit * 100 + 50:
+                self.issue_ticket(plate1, plate2, speed_100)
 
     def issue_ticket(self, plate1: Plate, plate2: Plate, speed_100: int) -> None:
         ticket = Ticket(
@@ -231,116 +415,137 @@ class Server:
             plate2.timestamp,
             speed_100,
         )
-        self.ticket_queue.put(ticket)
-        return
-
-    def process_ticket_queue(self) -> None:
-        ticket_history: dict[str, set[int]] = {}
-        while True:
-            ticket_batch: list[Ticket] = []
-            while True:
-                try:
-                    ticket = self.ticket_queue.get_nowait()
-                except Empty:
-                    break
-                ticket_batch.append(ticket)
-            if not ticket_batch:
-                time.sleep(0.01)
-            with self.dispatchers_lock:
-                dispatchers_snapshot = list(self.dispatchers)
-            requeue: list[Ticket] = []
-            for ticket in ticket_batch:
-                day1 = ticket.timestamp1 // 86400
-                day2 = ticket.timestamp2 // 86400
-                ticket_history_days = ticket_history.get(ticket.plate, set())
-                if day1 in ticket_history_days or day2 in ticket_history_days:
-                    continue
-                sent = False
-                for dispatcher in dispatchers_snapshot:
-                    if ticket.road not in dispatcher.roads:
-                        continue
-                    try:
-                        self.send_ticket(dispatcher, ticket)
-                        ticket_history.setdefault(ticket.plate, set()).update(
-                            (day1, day2)
-                        )
-                        sent = True
-                        break
-                    except (ConnectionResetError, BrokenPipeError, OSError):
-                        continue
-                if not sent:
-                    requeue.append(ticket)
-            if requeue:
-                for ticket in requeue:
-                    self.ticket_queue.put(ticket)
-
-    def send_ticket(self, dispatcher: Dispatcher, ticket: Ticket) -> None:
-        with dispatcher.connection_lock:
-            dispatcher.conn.sendall(
-                MessageType.TICKET.to_bytes(1, "big")
-                + len(ticket.plate).to_bytes(1, "big")
-                + ticket.plate.encode()
-                + (ticket.road).to_bytes(2, "big")
-                + (ticket.mile1).to_bytes(2, "big")
-                + (ticket.timestamp1).to_bytes(4, "big")
-                + (ticket.mile2).to_bytes(2, "big")
-                + (ticket.timestamp2).to_bytes(4, "big")
-                + (ticket.speed).to_bytes(2, "big")
-            )
+        if self.journal is not None:
+            self.journal.append_ticket(ticket.as_record())
+        self.metrics.increment("tickets_issued")
+        self.dispatch_ticket(ticket)
 
-    def process_heartbeat(
-        self, conn: socket.socket, connection_lock: threading.Lock, buffer: bytes
-    ) -> None:
-        interval = int.from_bytes(buffer[1:5], "big") / 10
-        if interval == 0:
+    def dispatch_ticket(self, ticket: Ticket) -> None:
+        """Send ticket to a dispatcher for its road, or hold it until one connects.
+
+        Tickets for a plate on a day it has already been ticketed are dropped,
+        as are tickets from days the ticket history no longer covers, since
+        whether the plate was ticketed on them is no longer known.
+        """
+        day1 = ticket.timestamp1 // SECONDS_PER_DAY
+        day2 = ticket.timestamp2 // SECONDS_PER_DAY
+        first_day = self.first_retained_day()
+        if first_day is not None and day1 < first_day:
             return
-        next_heartbeat = time.time() + interval
-        while True:
-            delay = next_heartbeat - time.time()
-            if delay > 0:
-                time.sleep(delay)
-            next_heartbeat = time.time() + interval
-            try:
-                with connection_lock:
-                    conn.sendall(MessageType.HEARTBEAT.to_bytes(1, "big"))
-            except (
-                ConnectionResetError,
-                BrokenPipeError,
-                OSError,
-            ) as e:
+        for ticketed_days in (
+            self.ticket_history.get(ticket.plate, ()),
+            self.unsent_ticket_days.get(ticket.plate, ()),
+        ):
+            if day1 in ticketed_days or day2 in ticketed_days:
+                return
+        for dispatcher in self.dispatchers.get(ticket.road, ()):
+            if not dispatcher.transport.is_closing():
                 break
+        else:
+            self.pending_tickets.setdefault(ticket.road, []).append(ticket)
+            return
+        # Writes are flushed together at the end of the loop iteration, so a
+        # burst of tickets goes out in one sendmsg call.
+        transport = dispatcher.transport
+        transport.write(encode_ticket(*ticket.as_record()))
+        self.metrics.increment("tickets_sent")
+        self.unsent_ticket_days.setdefault(ticket.plate, set()).update((day1, day2))
+        dispatcher.unsent.append(
+            (transport.bytes_sent + transport.get_write_buffer_size(), ticket)
+        )
+        self.record_sent_tickets(dispatcher)
 
-    def process_camera(self, buffer: bytes) -> Camera:
-        road = int.from_bytes(buffer[1:3], "big")
-        mile = int.from_bytes(buffer[3:5], "big")
-        limit = int.from_bytes(buffer[5:7], "big")
+    def record_sent_tickets(self, dispatcher: Dispatcher) -> None:
+        """Move the tickets dispatcher has sent into the ticket history."""
+        bytes_sent = dispatcher.transport.bytes_sent
+        unsent = dispatcher.unsent
+        while unsent and unsent[0][0] <= bytes_sent:
+            ticket = unsent.popleft()[1]
+            self.forget_unsent_ticket(ticket)
+            for day in {
+                ticket.timestamp1 // SECONDS_PER_DAY,
+                ticket.timestamp2 // SECONDS_PER_DAY,
+            }:
+                self.record_ticketed(ticket.plate, day)
+                if self.journal is not None:
+                    self.journal.append_ticketed(ticket.plate, day)
+
+    def forget_unsent_ticket(self, ticket: Ticket) -> None:
+        days = self.unsent_ticket_days[ticket.plate]
+        days.discard(ticket.timestamp1 // SECONDS_PER_DAY)
+        days.discard(ticket.timestamp2 // SECONDS_PER_DAY)
+        if not days:
+            del self.unsent_ticket_days[ticket.plate]
+
+    def record_ticketed(self, plate: str, day: int) -> None:
+        """Note that plate was ticketed on day, and forget its sightings then.
+
+        A plate is never ticketed twice in a day, so observations from a day
+        it has been ticketed on are dead weight.
+        """
+        self.ticket_history.setdefault(plate, set()).add(day)
+        if self.retention_horizon is not None:
+            self.ticketed_by_day.setdefault(day, set()).add(plate)
+        self.drop_plates(
+            plate,
+            lambda observation: observation.timestamp // SECONDS_PER_DAY != day,
+        )
+
+    def process_camera(self, road: int, mile: int, limit: int) -> Camera:
         camera = Camera(0, road, mile, limit)
         return camera
 
-    def process_dispatcher(
-        self, buffer: bytes, conn: socket.socket, connection_lock: threading.Lock
-    ) -> Dispatcher:
-        numroads = buffer[1]
-        roads = []
-        idx = 2
-        for _ in range(numroads):
-            roads.append(int.from_bytes(buffer[idx : idx + 2], "big"))
-            idx += 2
-        dispatcher = Dispatcher(0, roads, conn, connection_lock)
-        with self.dispatchers_lock:
-            self.dispatchers.append(dispatcher)
+    def process_dispatcher(self, roads: list[int], transport: Transport) -> Dispatcher:
+        dispatcher = Dispatcher(0, roads, transport)
+        for road in roads:
+            self.dispatchers.setdefault(road, []).append(dispatcher)
+        for road in roads:
+            for ticket in self.pending_tickets.pop(road, ()):
+                self.dispatch_ticket(ticket)
         return dispatcher
 
+    def remove_dispatcher(self, dispatcher: Dispatcher) -> None:
+        """Forget a closed dispatcher, passing on the tickets it never sent."""
+        for road in dispatcher.roads:
+            self.dispatchers[road] = [
+                road_dispatcher
+                for road_dispatcher in self.dispatchers.get(road, ())
+                if road_dispatcher is not dispatcher
+            ]
+        self.record_sent_tickets(dispatcher)
+        unsent = [ticket for _, ticket in dispatcher.unsent]
+        dispatcher.unsent.clear()
+        for ticket in unsent:
+            self.forget_unsent_ticket(ticket)
+        for ticket in unsent:
+            self.dispatch_ticket(ticket)
+
     def close(self) -> None:
-        try:
-            self.sock.shutdown(socket.SHUT_RDWR)
-        except OSError:
-            pass
-        self.sock.close()
+        super().close()
+        if self.journal is not None:
+            self.journal.close()
 
 
 def main() -> None:
-    server = Server("0.0.0.0", 4444)
+    parser = argparse.ArgumentParser(description="Speed Daemon server")
+    parser.add_argument(
+        "journal_dir",
+        nargs="?",
+        help="directory to journal state to, so it survives restarts",
+    )
+    parser.add_argument(
+        "--retention-horizon",
+        type=int,
+        metavar="SECONDS",
+        help="drop observations this much older than the newest one seen",
+    )
+    args = parser.parse_args()
+    server = Server(
+        "0.0.0.0",
+        4444,
+        retention_horizon=args.retention_horizon,
+        journal_dir=args.journal_dir,
+    )
     try:
         server.handle_connections()
     except KeyboardInterrupt:
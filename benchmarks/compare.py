@@ -0,0 +1,101 @@
+"""Compare two JSON benchmark reports and flag regressions.
+
+Works on the reports the scripts here write with --report, and on
+pytest-benchmark's --benchmark-json output, where each benchmark is compared
+by its min, median and mean time and, for test_hot_paths.py, the items per
+second behind its min. Numbers are matched
+up by their path through the report. Names ending in _per_sec count as
+higher-is-better. Lower-is-better covers names ending in _ms or _us,
+numbers directly under such a name (like latency_ms / p99), and RSS in
+KiB. Everything else is ignored. Exits 1 if anything got worse by more
+than --threshold.
+
+    python benchmarks/compare.py before.json after.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+
+def direction(path: tuple[str, ...]) -> int:
+    """1 if bigger is better, -1 if smaller is better, 0 if not a measurement."""
+    name = path[-1]
+    if name.endswith("_per_sec"):
+        return 1
+    if name.endswith(("_ms", "_us")) or "rss_kib" in name:
+        return -1
+    if len(path) > 1 and path[-2].endswith(("_ms", "_us")):
+        return -1
+    return 0
+
+
+def from_pytest_benchmark(report: dict) -> dict:
+    """Turn pytest-benchmark's JSON into the nested dicts the others use."""
+    results = {}
+    for benchmark in report["benchmarks"]:
+        stats = benchmark["stats"]
+        result = {
+            "min_us": stats["min"] * 1_000_000,
+            "median_us": stats["median"] * 1_000_000,
+            "mean_us": stats["mean"] * 1_000_000,
+        }
+        items = benchmark.get("extra_info", {}).get("items")
+        if items and stats["min"]:
+            result["items_per_sec"] = items / stats["min"]
+        results[benchmark["fullname"]] = result
+    return results
+
+
+def load(path: str) -> dict:
+    report = json.loads(Path(path).read_text())
+    if isinstance(report, dict) and "machine_info" in report:
+        return from_pytest_benchmark(report)
+    return report
+
+
+def measurements(report: object, path: tuple[str, ...] = ()) -> Iterator:
+    if isinstance(report, dict):
+        for key, value in report.items():
+            yield from measurements(value, path + (str(key),))
+    elif isinstance(report, (int, float)) and not isinstance(report, bool):
+        if path and direction(path):
+            yield path, float(report)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fractional change that counts as a regression (default 0.1)",
+    )
+    args = parser.parse_args()
+
+    before = dict(measurements(load(args.before)))
+    after = dict(measurements(load(args.after)))
+    regressions = 0
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        if old == 0:
+            continue
+        # Positive change is an improvement, whichever way the metric runs.
+        change = (new - old) / old * direction(path) or 0.0
+        flag = ""
+        if change < -args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{' / '.join(path):70} {old:14.2f} {new:14.2f} {change:+8.1%}{flag}")
+    for path in sorted(before.keys() - after.keys()):
+        print(f"{' / '.join(path):70} missing from {args.after}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
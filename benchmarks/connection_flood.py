@@ -0,0 +1,274 @@
+"""Flood a server with idle connections and check existing clients keep going.
+
+A few clients connect to 01_prime_time first and keep sending requests,
+one at a time. Partway through, a flood of connections arrives. Each flood
+connection sends an unterminated 32 KiB line and then goes quiet. The report
+gives the clients' request rate and latency before, during and after the
+flood, the server's peak RSS and thread count, and the server's own metrics
+taken during the flood.
+
+Halfway through the flood a late client connects and sends one request, to
+check that idle flood connections cannot lock newcomers out. It has
+--late-timeout seconds to get its answer, while the flood connections stay
+open.
+
+With max_connections set, the flood beyond the limit waits in the listen
+backlog instead of costing the server memory, and the server evicts idle
+flood connections to make room. Run with --max-connections 0 to see the
+server without a limit.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+REQUEST = b'{"method":"isPrime","number":104729}\n'
+FLOOD_PAYLOAD = b"x" * 32768
+
+
+def run_server(port_pipe, max_connections: int, stats_port: int) -> None:
+    os.environ["PROTOHACKERS_LOG_LEVEL"] = "WARNING"
+    os.environ["PROTOHACKERS_STATS_PORT"] = str(stats_port)
+    os.environ["PROTOHACKERS_MAX_CONNECTIONS"] = str(max_connections)
+    sys.stdout = sys.stderr
+    prime_time = importlib.import_module("01_prime_time")
+    server = prime_time.Server("127.0.0.1", 0)
+    port_pipe.send(server.sock.getsockname()[1])
+    server.handle_connections()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_status(pid: int) -> dict[str, int]:
+    status = {}
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                if key in ("Threads", "VmRSS"):
+                    status[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return status
+
+
+def fetch_stats(port: int) -> dict:
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as conn:
+        data = b""
+        while chunk := conn.recv(65536):
+            data += chunk
+    return json.loads(data)
+
+
+class Client(threading.Thread):
+    def __init__(self, port: int, stop: threading.Event) -> None:
+        super().__init__(daemon=True)
+        self.conn = socket.create_connection(("127.0.0.1", port))
+        self.conn.settimeout(10)
+        self.stop = stop
+        # (time the response arrived, latency)
+        self.samples: list[tuple[float, float]] = []
+        self.errors: list[str] = []
+
+    def run(self) -> None:
+        buffer = b""
+        try:
+            while not self.stop.is_set():
+                started = time.perf_counter()
+                self.conn.sendall(REQUEST)
+                while b"\n" not in buffer:
+                    chunk = self.conn.recv(4096)
+                    if not chunk:
+                        raise ConnectionError("server closed the connection")
+                    buffer += chunk
+                buffer = buffer[buffer.index(b"\n") + 1 :]
+                finished = time.perf_counter()
+                self.samples.append((finished, finished - started))
+        except (OSError, ConnectionError) as e:
+            self.errors.append(repr(e))
+
+
+def late_client(port: int, timeout: float, result: dict) -> None:
+    """Connect once the flood is underway; record how long an answer takes."""
+    started = time.perf_counter()
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as conn:
+            conn.settimeout(max(0.1, started + timeout - time.perf_counter()))
+            conn.sendall(REQUEST)
+            buffer = b""
+            while b"\n" not in buffer:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    raise ConnectionError("server closed the connection")
+                buffer += chunk
+        result["latency_ms"] = (time.perf_counter() - started) * 1000
+    except (OSError, ConnectionError) as e:
+        result["error"] = repr(e)
+
+
+def flood(port: int, count: int, stop: threading.Event, opened: list) -> None:
+    """Open count connections without blocking and send each one payload."""
+    selector = selectors.DefaultSelector()
+    for _ in range(count):
+        sock = socket.socket()
+        sock.setblocking(False)
+        sock.connect_ex(("127.0.0.1", port))
+        opened.append(sock)
+        selector.register(sock, selectors.EVENT_WRITE)
+    pending = count
+    while pending and not stop.is_set():
+        for key, _ in selector.select(0.1):
+            sock = key.fileobj
+            selector.unregister(sock)
+            pending -= 1
+            try:
+                sock.send(FLOOD_PAYLOAD)
+            except OSError:
+                pass
+    selector.close()
+
+
+def summarize(samples: list[tuple[float, float]], start: float, end: float) -> dict:
+    latencies = sorted(latency for at, latency in samples if start <= at < end)
+    if not latencies:
+        return {"requests": 0, "requests_per_sec": 0.0}
+
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / (end - start),
+        "p50_ms": percentile(0.5) * 1000,
+        "p99_ms": percentile(0.99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--flood", type=int, default=5000)
+    parser.add_argument("--max-connections", type=int, default=256)
+    parser.add_argument("--phase", type=float, default=3.0, help="seconds per phase")
+    parser.add_argument(
+        "--late-timeout",
+        type=float,
+        default=20.0,
+        help="seconds a client arriving during the flood may wait for an answer",
+    )
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    stats_port = free_port()
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    server = context.Process(
+        target=run_server,
+        args=(sender, args.max_connections, stats_port),
+        daemon=True,
+    )
+    server.start()
+    port = receiver.recv()
+
+    stop = threading.Event()
+    flood_stop = threading.Event()
+    peak = {"VmRSS": 0, "Threads": 0}
+
+    def watch() -> None:
+        while not stop.is_set():
+            for key, value in process_status(server.pid).items():
+                peak[key] = max(peak[key], value)
+            time.sleep(0.05)
+
+    threading.Thread(target=watch, daemon=True).start()
+    clients = [Client(port, stop) for _ in range(args.clients)]
+    for client in clients:
+        client.start()
+
+    flood_sockets: list[socket.socket] = []
+    baseline_start = time.perf_counter()
+    time.sleep(args.phase)
+    baseline_rss = process_status(server.pid).get("VmRSS", 0)
+    flood_start = time.perf_counter()
+    flood_thread = threading.Thread(
+        target=flood, args=(port, args.flood, flood_stop, flood_sockets), daemon=True
+    )
+    flood_thread.start()
+    time.sleep(args.phase / 2)
+    late: dict = {}
+    late_thread = threading.Thread(
+        target=late_client, args=(port, args.late_timeout, late), daemon=True
+    )
+    late_thread.start()
+    time.sleep(args.phase / 2)
+    stats = fetch_stats(stats_port)
+    flood_end = time.perf_counter()
+    # The flood stays open until the late client is done, so it is measured
+    # against a full server.
+    late_thread.join(args.late_timeout + 1)
+    flood_stop.set()
+    flood_thread.join()
+    for sock in flood_sockets:
+        sock.close()
+    time.sleep(args.phase)
+    recovery_end = time.perf_counter()
+    stop.set()
+    for client in clients:
+        client.join(5)
+    server.kill()
+    server.join()
+
+    samples = [sample for client in clients for sample in client.samples]
+    errors = [error for client in clients for error in client.errors]
+    if "error" in late:
+        errors.append(f"late client: {late['error']}")
+    phases = {
+        "baseline": summarize(samples, baseline_start, flood_start),
+        "flood": summarize(samples, flood_start, flood_end),
+        "recovery": summarize(samples, flood_end, recovery_end),
+    }
+    report = {
+        "clients": args.clients,
+        "flood_connections": args.flood,
+        "max_connections": args.max_connections or None,
+        "phases": phases,
+        "late_client_ms": late.get("latency_ms"),
+        "errors": errors,
+        "server_rss_kib_baseline": baseline_rss,
+        "server_rss_kib_peak": peak["VmRSS"],
+        "server_threads_peak": peak["Threads"],
+        "server_stats_during_flood": {
+            "counters": stats["counters"],
+            "gauges": stats["gauges"],
+        },
+        "ok": (
+            not errors
+            and "latency_ms" in late
+            and all(phase["requests"] for phase in phases.values())
+        ),
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Microbenchmarks for LineFramer against the old str split loop.
+
+The old loop, which 01, 03 and 05 used before LineFramer, decodes every chunk
+onto a str buffer and splits one line off at a time. Both approaches are fed
+the same chunks and checked to produce the same lines before anything is
+timed. Prints a JSON report with the best of three runs for each case.
+
+    python benchmarks/line_framing.py --report line_framing.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from protohackers import LineFramer  # noqa: E402
+
+
+def split_lines(chunks: list[bytes]) -> list[str]:
+    lines = []
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.decode()
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            lines.append(line)
+    return lines
+
+
+def framer_lines(chunks: list[bytes]) -> list[str]:
+    lines = []
+    framer = LineFramer(max_line_length=1 << 24)
+    for chunk in chunks:
+        framer.feed(chunk)
+        for line in framer.lines():
+            lines.append(line.decode())
+    return lines
+
+
+def chunked(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def cases() -> dict[str, tuple[list[bytes], int]]:
+    short_lines = b"".join(
+        b'{"method":"isPrime","number":%d}\n' % i for i in range(20_000)
+    )
+    long_line = b"x" * 1_000_000 + b"\n"
+    return {
+        # A client pipelining a large burst in one read.
+        "one burst of 20k short lines": ([short_lines], 20_000),
+        # The same stream as it usually arrives off the socket.
+        "20k short lines in 64 KiB reads": (chunked(short_lines, 65536), 20_000),
+        # One long line trickling in, which the old loop rescans on every read.
+        "1 MB line in 4 KiB reads": (chunked(long_line, 4096), 1),
+    }
+
+
+def bench(
+    function: Callable[[list[bytes]], list[str]], chunks: list[bytes]
+) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        function(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    report = {}
+    for name, (chunks, line_count) in cases().items():
+        expected = split_lines(chunks)
+        assert len(expected) == line_count
+        assert framer_lines(chunks) == expected
+        old = bench(split_lines, chunks)
+        new = bench(framer_lines, chunks)
+        report[name] = {
+            "str_split_ms": old * 1000,
+            "line_framer_ms": new * 1000,
+            "speedup": old / new,
+        }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""Connections/sec and requests/sec for each solution over loopback.
+
+Each server runs in a child process. Connections/sec opens a connection, does
+a single request and response and closes it, over and over. Requests/sec
+keeps one connection per client and pipelines requests in windows.
+
+Pass --compare REV to run the same scenarios against the tree at a git
+revision as well, e.g. the commit before the event loop port:
+
+    python benchmarks/server_throughput.py --compare HEAD~1
+
+05_mob_in_the_middle proxies to a stand-in chat server in this process that
+greets each client and echoes its lines back. Revisions whose server cannot
+be pointed at another upstream skip it. 04_unusual_database_program is UDP,
+so it has no connections/sec.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import multiprocessing
+import socket
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WINDOW = 50
+
+
+def run_server(tree: str, module: str, options: dict, port_pipe) -> None:
+    sys.path.insert(0, tree)
+    # Older solutions print on every request, which would swamp the report.
+    sys.stdout = open("/dev/null", "w")
+    try:
+        server = importlib.import_module(module).Server("127.0.0.1", 0, **options)
+    except TypeError:
+        # This revision's server does not take the options; skip it.
+        port_pipe.send(None)
+        return
+    port_pipe.send(server.sock.getsockname()[1])
+    server.handle_connections()
+
+
+def connect(port: int) -> socket.socket:
+    conn = socket.create_connection(("127.0.0.1", port))
+    conn.settimeout(5)
+    return conn
+
+
+def recv_exactly(conn: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed early")
+        data += chunk
+    return data
+
+
+def recv_lines(conn: socket.socket, count: int, buffer: bytearray) -> None:
+    while buffer.count(b"\n") < count:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError("connection closed early")
+        buffer += chunk
+    for _ in range(count):
+        del buffer[: buffer.index(b"\n") + 1]
+
+
+class Scenario:
+    module = ""
+    # False for UDP servers, which have no connections to time.
+    connection_oriented = True
+
+    def server_options(self) -> dict:
+        """Keyword arguments for the server under test, besides its address."""
+        return {}
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        raise NotImplementedError
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        raise NotImplementedError
+
+
+class Echo(Scenario):
+    module = "00_smoke_test"
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            conn.sendall(b"ping\n")
+            recv_exactly(conn, 5)
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        conn = connect(port)
+
+        def batch(round_idx: int) -> None:
+            conn.sendall(b"ping\n" * WINDOW)
+            recv_exactly(conn, 5 * WINDOW)
+
+        return batch
+
+
+class PrimeTime(Scenario):
+    module = "01_prime_time"
+    request = b'{"method":"isPrime","number":104729}\n'
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            conn.sendall(self.request)
+            recv_lines(conn, 1, bytearray())
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        conn = connect(port)
+        buffer = bytearray()
+
+        def batch(round_idx: int) -> None:
+            conn.sendall(self.request * WINDOW)
+            recv_lines(conn, WINDOW, buffer)
+
+        return batch
+
+
+class MeansToAnEnd(Scenario):
+    module = "02_means_to_an_end"
+    query = b"Q" + struct.pack(">ii", 0, 1000)
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            conn.sendall(b"I" + struct.pack(">ii", 1, 100) + self.query)
+            recv_exactly(conn, 4)
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        conn = connect(port)
+        conn.sendall(
+            b"".join(b"I" + struct.pack(">ii", i, i) for i in range(1000))
+        )
+
+        def batch(round_idx: int) -> None:
+            conn.sendall(self.query * WINDOW)
+            recv_exactly(conn, 4 * WINDOW)
+
+        return batch
+
+
+class BudgetChat(Scenario):
+    module = "03_budget_chat"
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            buffer = bytearray()
+            recv_lines(conn, 1, buffer)
+            conn.sendall(f"c{client}x{idx}\n".encode())
+            recv_lines(conn, 1, buffer)
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        # Every client gets its own room of two, as far as it can tell: the
+        # listener only counts lines from its own sender.
+        sender, listener = connect(port), connect(port)
+        buffer = bytearray()
+        for conn, name in ((listener, f"l{client}"), (sender, f"s{client}")):
+            recv_lines(conn, 1, bytearray())
+            conn.sendall(f"{name}\n".encode())
+            recv_lines(conn, 1, bytearray())
+        recv_lines(listener, 1, buffer)
+        prefix = f"[s{client}]".encode()
+
+        def batch(round_idx: int) -> None:
+            sender.sendall(b"hello\n" * WINDOW)
+            seen = 0
+            while seen < WINDOW:
+                chunk = listener.recv(65536)
+                if not chunk:
+                    raise ConnectionError("connection closed early")
+                buffer.extend(chunk)
+                while b"\n" in buffer:
+                    end = buffer.index(b"\n") + 1
+                    seen += buffer.startswith(prefix)
+                    del buffer[:end]
+
+        return batch
+
+
+class UnusualDatabase(Scenario):
+    module = "04_unusual_database_program"
+    connection_oriented = False
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        conn = socket.socket(type=socket.SOCK_DGRAM)
+        conn.settimeout(1)
+        address = ("127.0.0.1", port)
+        conn.sendto(f"key{client}=value".encode(), address)
+
+        def batch(round_idx: int) -> None:
+            # One at a time, since UDP would drop a pipelined window.
+            for _ in range(WINDOW):
+                conn.sendto(f"key{client}".encode(), address)
+                conn.recvfrom(1024)
+
+        return batch
+
+
+class FakeChat:
+    """Stand-in upstream for 05: greets each client, then echoes its lines."""
+
+    def __init__(self) -> None:
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self) -> None:
+        while True:
+            conn, _ = self.sock.accept()
+            threading.Thread(target=self.serve, args=(conn,), daemon=True).start()
+
+    def serve(self, conn: socket.socket) -> None:
+        with conn:
+            try:
+                conn.sendall(b"Welcome to budgetchat! What shall I call you?\n")
+                while chunk := conn.recv(65536):
+                    conn.sendall(chunk)
+            except OSError:
+                pass
+
+
+class MobInTheMiddle(Scenario):
+    module = "05_mob_in_the_middle"
+    # Rewritten by the proxy on the way up and again on the way back.
+    message = b"Send payment to 7F1u3wSD5RbOHQmupo9nx4TnhQ please\n"
+
+    def __init__(self) -> None:
+        self.upstream: FakeChat | None = None
+
+    def server_options(self) -> dict:
+        if self.upstream is None:
+            self.upstream = FakeChat()
+        return {"upstream": self.upstream.address}
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            buffer = bytearray()
+            recv_lines(conn, 1, buffer)
+            conn.sendall(f"c{client}x{idx}\n".encode())
+            recv_lines(conn, 1, buffer)
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        conn = connect(port)
+        buffer = bytearray()
+        recv_lines(conn, 1, buffer)
+
+        def batch(round_idx: int) -> None:
+            conn.sendall(self.message * WINDOW)
+            recv_lines(conn, WINDOW, buffer)
+
+        return batch
+
+
+class SpeedDaemon(Scenario):
+    module = "06_speed_daemon"
+    error_trigger = b"\x20\x01A\x00\x00\x00\x00"
+
+    def connection(self, port: int, client: int, idx: int) -> None:
+        with connect(port) as conn:
+            conn.sendall(self.error_trigger)
+            recv_exactly(conn, 13)
+
+    def requests(self, port: int, client: int) -> Callable[[int], None]:
+        # A request is a pair of observations and the ticket they produce.
+        # Plates must be unique across clients too, since a car is only
+        # ticketed once a day whatever the road.
+        road = client + 1
+        dispatcher = connect(port)
+        dispatcher.sendall(b"\x81\x01" + struct.pack(">H", road))
+        cameras = [connect(port), connect(port)]
+        for mile, camera in zip((0, 10), cameras):
+            camera.sendall(b"\x80" + struct.pack(">HHH", road, mile, 60))
+        time.sleep(0.1)
+        plate_length = 12
+
+        def batch(round_idx: int) -> None:
+            plates = [
+                f"{client:02d}{round_idx:06d}{i:04d}".encode() for i in range(WINDOW)
+            ]
+            for timestamp, camera in zip((0, 300), cameras):
+                camera.sendall(
+                    b"".join(
+                        b"\x20"
+                        + bytes((plate_length,))
+                        + plate
+                        + struct.pack(">I", timestamp)
+                        for plate in plates
+                    )
+                )
+            recv_exactly(dispatcher, (2 + plate_length + 16) * WINDOW)
+
+        return batch
+
+
+SCENARIOS = [
+    Echo(),
+    PrimeTime(),
+    MeansToAnEnd(),
+    BudgetChat(),
+    UnusualDatabase(),
+    MobInTheMiddle(),
+    SpeedDaemon(),
+]
+
+
+def measure(
+    clients: int, duration: float, work: Callable[[int], Callable[[int], None]]
+) -> float | None:
+    """Run work(client)(idx) in a loop on every client; return completions/sec."""
+    counts = [0] * clients
+    errors: list[Exception] = []
+    deadline = time.perf_counter() + duration
+
+    def client_loop(client: int) -> None:
+        try:
+            step = work(client)
+            while time.perf_counter() < deadline:
+                step(counts[client])
+                counts[client] += 1
+        except (OSError, ConnectionError) as e:
+            errors.append(e)
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=client_loop, args=(client,), daemon=True)
+        for client in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(duration + 10)
+    elapsed = time.perf_counter() - start
+    if errors:
+        return None
+    return sum(counts) / elapsed
+
+
+def run_tree(tree: Path, clients: int, duration: float) -> dict[str, dict]:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for scenario in SCENARIOS:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=run_server,
+            args=(str(tree), scenario.module, scenario.server_options(), sender),
+            daemon=True,
+        )
+        process.start()
+        port = receiver.recv()
+        if port is None:
+            process.join()
+            continue
+        try:
+            connections = None
+            if scenario.connection_oriented:
+                connections = measure(
+                    clients,
+                    duration,
+                    lambda client: lambda idx: scenario.connection(port, client, idx),
+                )
+            batches = measure(
+                clients, duration, lambda client: scenario.requests(port, client)
+            )
+        finally:
+            process.kill()
+            process.join()
+        results[scenario.module] = {
+            "connections_per_sec": connections,
+            "requests_per_sec": batches * WINDOW if batches is not None else None,
+        }
+    return results
+
+
+def export_tree(revision: str, directory: str) -> Path:
+    archive = subprocess.run(
+        ["git", "-C", str(ROOT), "archive", revision],
+        check=True,
+        capture_output=True,
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return Path(directory)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--compare", metavar="REV", help="also run this revision")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    report = {"current": run_tree(ROOT, args.clients, args.duration)}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as directory:
+            tree = export_tree(args.compare, directory)
+            report[args.compare] = run_tree(tree, args.clients, args.duration)
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
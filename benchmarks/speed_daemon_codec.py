@@ -0,0 +1,94 @@
+"""Throughput benchmark for the Speed Daemon codec.
+
+Decodes a random message stream split at random chunk boundaries of up to
+1 KiB, as it might come off the socket, and prints a JSON report. That the
+decoder copes with any split is checked by test_speed_daemon_codec.py.
+
+    python benchmarks/speed_daemon_codec.py --messages 200000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from speed_daemon_codec import (  # noqa: E402
+    Decoder,
+    encode_camera,
+    encode_dispatcher,
+    encode_plate,
+    encode_want_heartbeat,
+)
+
+
+def random_message(rng: random.Random) -> bytes:
+    kind = rng.randrange(10)
+    if kind == 0:
+        return encode_camera(
+            rng.randrange(65536), rng.randrange(65536), rng.randrange(65536)
+        )
+    if kind == 1:
+        return encode_dispatcher(
+            [rng.randrange(65536) for _ in range(rng.randrange(256))]
+        )
+    if kind == 2:
+        return encode_want_heartbeat(rng.randrange(2**32))
+    plate = "".join(
+        rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+        for _ in range(rng.randrange(1, 12))
+    )
+    return encode_plate(plate, rng.randrange(2**32))
+
+
+def decode_all(chunks: list[bytes]) -> list:
+    decoder = Decoder()
+    messages = []
+    for chunk in chunks:
+        decoder.feed(chunk)
+        while (message := decoder.next_message()) is not None:
+            messages.append(message)
+    return messages
+
+
+def split_randomly(stream: bytes, rng: random.Random, max_chunk: int) -> list[bytes]:
+    chunks = []
+    idx = 0
+    while idx < len(stream):
+        size = rng.randint(1, max_chunk)
+        chunks.append(stream[idx : idx + size])
+        idx += size
+    return chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    message_count = args.messages
+    stream = b"".join(random_message(rng) for _ in range(message_count))
+    chunks = split_randomly(stream, rng, 1024)
+    start = time.perf_counter()
+    decode_all(chunks)
+    elapsed = time.perf_counter() - start
+    report = {
+        "messages": message_count,
+        "bytes": len(stream),
+        "decode_ms": elapsed * 1000,
+        "messages_per_sec": message_count / elapsed,
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
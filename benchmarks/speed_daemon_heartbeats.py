@@ -0,0 +1,146 @@
+"""Heartbeat jitter check for the Speed Daemon at scale.
+
+Many clients connect to 06_speed_daemon as cameras and then all ask for
+heartbeats at the same interval. One thread reads them all and notes when each
+heartbeat arrives. A client's k-th heartbeat is due k intervals after its
+first one, and how far behind that it arrives is its lateness. The report
+gives lateness percentiles over every heartbeat, the worst lateness and
+how many heartbeats never came. Exits 1 if the worst lateness is over
+--max-lateness-ms or any heartbeat went missing.
+
+    python benchmarks/speed_daemon_heartbeats.py --clients 2000 --interval 2
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from speed_daemon_codec import (  # noqa: E402
+    HEARTBEAT_FRAME,
+    encode_camera,
+    encode_want_heartbeat,
+)
+
+
+def run_server(port_pipe) -> None:
+    os.environ["PROTOHACKERS_LOG_LEVEL"] = "WARNING"
+    sys.stdout = sys.stderr
+    speed_daemon = importlib.import_module("06_speed_daemon")
+    server = speed_daemon.Server("127.0.0.1", 0)
+    port_pipe.send(server.sock.getsockname()[1])
+    server.handle_connections()
+
+
+def collect(
+    port: int, clients: int, deciseconds: int, duration: float
+) -> list[list[float]]:
+    """Return the arrival times of every client's heartbeats."""
+    selector = selectors.DefaultSelector()
+    arrivals: list[list[float]] = [[] for _ in range(clients)]
+    conns = []
+    for client in range(clients):
+        # Identifying straight away keeps the server from timing out the
+        # first clients while the rest connect.
+        conn = socket.create_connection(("127.0.0.1", port))
+        conn.sendall(encode_camera(client + 1, 0, 60))
+        conns.append(conn)
+    # Everyone asks at once, just before reading starts, so no heartbeat sits
+    # unread long enough to skew its arrival time.
+    for client, conn in enumerate(conns):
+        conn.sendall(encode_want_heartbeat(deciseconds))
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ, client)
+    deadline = time.perf_counter() + duration
+    while (remaining := deadline - time.perf_counter()) > 0:
+        for key, _ in selector.select(remaining):
+            try:
+                data = key.fileobj.recv(4096)
+            except BlockingIOError:
+                continue
+            now = time.perf_counter()
+            if not data:
+                raise ConnectionError(f"client {key.data} was disconnected")
+            # Heartbeats that arrive together share a time.
+            arrivals[key.data].extend([now] * data.count(HEARTBEAT_FRAME))
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    selector.close()
+    return arrivals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument(
+        "--interval", type=int, default=1, help="heartbeat interval in deciseconds"
+    )
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--max-lateness-ms", type=float, default=250.0)
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    server = context.Process(target=run_server, args=(sender,), daemon=True)
+    server.start()
+    port = receiver.recv()
+    try:
+        arrivals = collect(port, args.clients, args.interval, args.duration)
+    finally:
+        server.kill()
+        server.join()
+
+    interval = args.interval / 10
+    lateness = []
+    worst = 0.0
+    missing = 0
+    for times in arrivals:
+        if not times:
+            missing += int(args.duration / interval)
+            continue
+        first = times[0]
+        # Heartbeats due between this client's first and last ones.
+        missing += max(0, int((times[-1] - first) / interval) + 1 - len(times))
+        client_lateness = [
+            at - (first + k * interval) for k, at in enumerate(times) if k
+        ]
+        lateness.extend(client_lateness)
+        worst = max([worst, *client_lateness])
+    lateness.sort()
+
+    def percentile(fraction: float) -> float:
+        if not lateness:
+            return 0.0
+        return lateness[min(len(lateness) - 1, int(fraction * len(lateness)))] * 1000
+
+    report = {
+        "clients": args.clients,
+        "interval_ms": interval * 1000,
+        "heartbeats": sum(len(times) for times in arrivals),
+        "missing": missing,
+        "lateness_ms": {
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+            "max": worst * 1000,
+        },
+    }
+    report["ok"] = missing == 0 and worst * 1000 <= args.max_lateness_ms
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Synthetic camera and dispatcher load harness for the Speed Daemon.
+
+Simulates roads lined with cameras and cars driving along them at known
+speeds, sent at a steady --rate of plates a second, plus dispatchers that
+connect late and periodically disconnect and reconnect. Each dispatcher
+covers its own share of the roads, and every road has two dispatchers when
+there are at least two. Checks that every speeding car gets exactly one
+ticket, that nobody else gets one and that the dispatchers really did
+reconnect, then prints a JSON report.
+
+Ticket latency runs from when a car could first be ticketed, or from when a
+dispatcher for its road was next connected if none was then.
+
+By default a server is started in a child process on a loopback port so its
+thread count and RSS can be sampled. Pass --port (and optionally --pid) to
+load an already running server instead.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from speed_daemon_codec import (  # noqa: E402
+    HEADER,
+    TICKET_FIELDS,
+    MessageType,
+    encode_camera,
+    encode_dispatcher,
+    encode_plate,
+)
+
+SPEED_LIMIT = 60
+CAMERA_SPACING = 10
+SPEEDING = 80
+LEGAL = 40
+
+
+def run_server(port_pipe) -> None:
+    # Keep stdout for the report.
+    sys.stdout = sys.stderr
+    speed_daemon = importlib.import_module("06_speed_daemon")
+    server = speed_daemon.Server("127.0.0.1", 0)
+    port_pipe.send(server.sock.getsockname()[1])
+    server.handle_connections()
+
+
+def process_status(pid: int) -> dict[str, int]:
+    status = {}
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                if key in ("Threads", "VmRSS"):
+                    status[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return status
+
+
+class Fleet:
+    def __init__(self, roads: int, cameras: int, cars: int) -> None:
+        self.roads = list(range(1, roads + 1))
+        self.miles = [i * CAMERA_SPACING for i in range(cameras)]
+        # Every car drives one road within a single day, so a speeding car
+        # should get exactly one ticket.
+        self.cars = [
+            (
+                f"LD{i:06d}",
+                self.roads[i % roads],
+                SPEEDING if i % 2 == 0 else LEGAL,
+                (i // roads) * 60 % 80_000,
+            )
+            for i in range(cars)
+        ]
+        self.expected = {plate for plate, _, speed, _ in self.cars if speed > 60}
+
+
+class Dispatchers:
+    def __init__(
+        self, port: int, roads: list[int], count: int, delay: float, reconnect: int
+    ) -> None:
+        self.port = port
+        # Dispatcher k covers the roads whose index is k or k + 1, modulo
+        # count, so no one dispatcher is sent every ticket.
+        self.roads = [
+            [
+                road
+                for idx, road in enumerate(roads)
+                if idx % count in (k, (k + 1) % count)
+            ]
+            for k in range(count)
+        ]
+        self.delay = delay
+        self.reconnect = reconnect
+        self.tickets: dict[str, list[float]] = {}
+        self.reconnects = 0
+        # The roads each connection covered, and from when until it began
+        # disconnecting.
+        self.coverage: list[tuple[list[int], float, float]] = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def start(self) -> list[threading.Thread]:
+        threads = [
+            threading.Thread(target=self.run, args=(roads,), daemon=True)
+            for roads in self.roads
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, roads: list[int]) -> None:
+        time.sleep(self.delay)
+        while not self.done.is_set():
+            conn = socket.create_connection(("127.0.0.1", self.port))
+            conn.sendall(encode_dispatcher(roads))
+            connected = time.perf_counter()
+            disconnecting = self.receive(conn)
+            conn.close()
+            with self.lock:
+                self.coverage.append((roads, connected, disconnecting))
+                if not self.done.is_set():
+                    self.reconnects += 1
+
+    def covered_from(self, road: int, since: float) -> float:
+        """When a dispatcher for road was first connected at or after since."""
+        return min(
+            (
+                max(connected, since)
+                for roads, connected, disconnecting in self.coverage
+                if road in roads and disconnecting > since
+            ),
+            default=since,
+        )
+
+    def receive(self, conn: socket.socket) -> float:
+        """Read tickets until it is time to reconnect.
+
+        Disconnecting half-closes the socket and drains it until the server
+        closes its side, so no ticket already written to us is lost. Returns
+        when the half-close happened.
+        """
+        buffer = bytearray()
+        received = 0
+        conn.settimeout(0.2)
+        half_closed = None
+        while True:
+            try:
+                chunk = conn.recv(65536)
+            except socket.timeout:
+                if self.done.is_set() and half_closed is None:
+                    conn.shutdown(socket.SHUT_WR)
+                    half_closed = time.perf_counter()
+                continue
+            if not chunk:
+                return half_closed if half_closed is not None else time.perf_counter()
+            buffer += chunk
+            received += self.parse(buffer)
+            if half_closed is None and (
+                self.done.is_set() or (self.reconnect and received >= self.reconnect)
+            ):
+                conn.shutdown(socket.SHUT_WR)
+                half_closed = time.perf_counter()
+
+    def parse(self, buffer: bytearray) -> int:
+        now = time.perf_counter()
+        offset = 0
+        tickets = 0
+        while offset < len(buffer):
+            if buffer[offset] == MessageType.HEARTBEAT:
+                offset += 1
+                continue
+            if offset + 2 > len(buffer):
+                break
+            kind, plate_length = HEADER.unpack_from(buffer, offset)
+            assert kind == MessageType.TICKET, f"unexpected message {kind:#x}"
+            plate_end = offset + 2 + plate_length
+            if plate_end + TICKET_FIELDS.size > len(buffer):
+                break
+            plate = buffer[offset + 2 : plate_end].decode("ascii")
+            offset = plate_end + TICKET_FIELDS.size
+            with self.lock:
+                self.tickets.setdefault(plate, []).append(now)
+            tickets += 1
+        del buffer[:offset]
+        return tickets
+
+
+def drive(
+    port: int, fleet: Fleet, batch: int, rate: float
+) -> tuple[dict[str, float], float]:
+    """Send every car's observations and note when each could first be ticketed.
+
+    Observations go out a batch of cars at a time, paced to rate plates a
+    second.
+    """
+    cameras = {}
+    for road in fleet.roads:
+        for mile in fleet.miles:
+            conn = socket.create_connection(("127.0.0.1", port))
+            conn.sendall(encode_camera(road, mile, SPEED_LIMIT))
+            cameras[road, mile] = conn
+    ticketable_at: dict[str, float] = {}
+    pending: dict[tuple[int, int], list[bytes]] = {key: [] for key in cameras}
+    start = time.perf_counter()
+    for idx, (plate, road, speed, departure) in enumerate(fleet.cars):
+        for mile in fleet.miles:
+            timestamp = departure + mile * 3600 // speed
+            pending[road, mile].append(encode_plate(plate, timestamp))
+        if idx % batch == batch - 1 or idx == len(fleet.cars) - 1:
+            due = start + idx * len(fleet.miles) / rate
+            time.sleep(max(0.0, due - time.perf_counter()))
+            for key, frames in pending.items():
+                if frames:
+                    cameras[key].sendall(b"".join(frames))
+                    frames.clear()
+            now = time.perf_counter()
+            for plate, *_ in fleet.cars[idx - idx % batch : idx + 1]:
+                ticketable_at[plate] = now
+    elapsed = time.perf_counter() - start
+    for conn in cameras.values():
+        conn.close()
+    return ticketable_at, elapsed
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, help="load an already running server")
+    parser.add_argument("--pid", type=int, help="pid of that server, for sampling")
+    parser.add_argument("--roads", type=int, default=10)
+    parser.add_argument("--cameras", type=int, default=3, help="cameras per road")
+    parser.add_argument("--cars", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=100, help="cars per send")
+    parser.add_argument(
+        "--rate", type=float, default=20_000, help="plates to send a second"
+    )
+    parser.add_argument("--dispatchers", type=int, default=4)
+    parser.add_argument(
+        "--dispatcher-delay", type=float, default=0.5, help="seconds to connect late"
+    )
+    parser.add_argument(
+        "--reconnect-every", type=int, default=1000, help="tickets per connection"
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    server_process = None
+    port, pid = args.port, args.pid
+    if port is None:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        server_process = multiprocessing.Process(
+            target=run_server, args=(sender,), daemon=True
+        )
+        server_process.start()
+        port, pid = receiver.recv(), server_process.pid
+
+    fleet = Fleet(args.roads, args.cameras, args.cars)
+    dispatchers = Dispatchers(
+        port,
+        fleet.roads,
+        args.dispatchers,
+        args.dispatcher_delay,
+        args.reconnect_every,
+    )
+    dispatchers.start()
+
+    peak = {"Threads": 0, "VmRSS": 0}
+    sampling = threading.Event()
+
+    def sample() -> None:
+        while not sampling.is_set():
+            for key, value in process_status(pid).items() if pid else ():
+                peak[key] = max(peak[key], value)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    ticketable_at, send_elapsed = drive(port, fleet, args.batch, args.rate)
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        with dispatchers.lock:
+            if fleet.expected <= dispatchers.tickets.keys():
+                break
+        time.sleep(0.05)
+    # Give stragglers, such as duplicates, a moment to show up.
+    time.sleep(0.5)
+    dispatchers.done.set()
+    sampling.set()
+    sampler.join()
+
+    with dispatchers.lock:
+        tickets = dict(dispatchers.tickets)
+    roads = {plate: road for plate, road, _, _ in fleet.cars}
+    latencies = [
+        (times[0] - dispatchers.covered_from(roads[plate], ticketable_at[plate]))
+        * 1000
+        for plate, times in tickets.items()
+        if plate in ticketable_at
+    ]
+    plates_sent = len(fleet.cars) * len(fleet.miles)
+    reconnects_expected = (
+        len(fleet.expected) // args.reconnect_every if args.reconnect_every else 0
+    )
+    report = {
+        "roads": len(fleet.roads),
+        "cameras": len(fleet.roads) * len(fleet.miles),
+        "cars": len(fleet.cars),
+        "dispatchers": args.dispatchers,
+        "dispatcher_reconnects": dispatchers.reconnects,
+        "dispatcher_reconnects_expected": reconnects_expected,
+        "plates_sent": plates_sent,
+        "plate_ingest_per_sec": plates_sent / send_elapsed,
+        "tickets_expected": len(fleet.expected),
+        "tickets_received": sum(len(times) for times in tickets.values()),
+        "missing": sorted(fleet.expected - tickets.keys()),
+        "unexpected": sorted(tickets.keys() - fleet.expected),
+        "duplicates": sorted(p for p, times in tickets.items() if len(times) > 1),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+        },
+        "server_threads_peak": peak["Threads"] or None,
+        "server_rss_kib_peak": peak["VmRSS"] or None,
+    }
+    report["ok"] = not (
+        report["missing"]
+        or report["unexpected"]
+        or report["duplicates"]
+        # Falling well short means tickets arrived in a few large bursts,
+        # so the reconnect path was barely exercised.
+        or dispatchers.reconnects < reconnects_expected // 2
+    )
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+    if server_process is not None:
+        server_process.terminate()
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Check that Speed Daemon memory stays flat under a multi-day camera stream.
+
+A fleet of cars drives past pairs of cameras every day for --days days,
+straight through Server.process_plate and check_for_ticket with no sockets
+involved. Some of the cars speed, and their tickets go to a dispatcher that
+discards them. tracemalloc measures what the server holds at the end of
+each day. Once the retention horizon has been passed, memory should stop
+growing. The check fails (exit 1) if the last day ends more than
+--tolerance above the first day to end with a full horizon behind it.
+
+    python benchmarks/speed_daemon_memory.py --days 7 --retention-horizon 86400
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("PROTOHACKERS_LOG_LEVEL", "ERROR")
+
+speed_daemon = importlib.import_module("06_speed_daemon")
+
+SECONDS_PER_DAY = 86400
+ROADS = 50
+SPEED_LIMIT = 60
+CAMERA_SPACING = 10
+
+
+class NullTransport:
+    """Dispatcher transport that throws its tickets away."""
+
+    bytes_sent = 0
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    def is_closing(self) -> bool:
+        return False
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+
+def drive(server, cameras: dict, cars: int, day: int, rng: random.Random) -> None:
+    """Send every car past two cameras on a random road, once, during day."""
+    for car in range(cars):
+        road = rng.randrange(ROADS)
+        # One car in ten speeds.
+        speed = 80 if car % 10 == 0 else 40
+        start = day * SECONDS_PER_DAY + rng.randrange(SECONDS_PER_DAY - 3600)
+        seconds = CAMERA_SPACING * 3600 // speed
+        for camera, timestamp in zip(cameras[road], (start, start + seconds)):
+            plate = server.process_plate(f"CAR{car:06d}", timestamp, camera)
+            if plate is not None:
+                server.check_for_ticket(plate, SPEED_LIMIT)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--cars", type=int, default=20_000, help="cars per day")
+    parser.add_argument(
+        "--retention-horizon", type=int, default=SECONDS_PER_DAY, metavar="SECONDS"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="growth allowed after the horizon, as a fraction (default 0.1)",
+    )
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    server = speed_daemon.Server(
+        "127.0.0.1", 0, retention_horizon=args.retention_horizon
+    )
+    server.sock.close()
+    cameras = {
+        road: [
+            speed_daemon.Camera(0, road, mile, SPEED_LIMIT)
+            for mile in (0, CAMERA_SPACING)
+        ]
+        for road in range(ROADS)
+    }
+    server.process_dispatcher(list(range(ROADS)), NullTransport())
+    rng = random.Random(0)
+
+    tracemalloc.start()
+    daily_kib = []
+    for day in range(args.days):
+        drive(server, cameras, args.cars, day, rng)
+        daily_kib.append(tracemalloc.get_traced_memory()[0] / 1024)
+    tracemalloc.stop()
+
+    # The first day to end with a full horizon of history behind today's.
+    horizon_days = -(-args.retention_horizon // SECONDS_PER_DAY)
+    steady_day = min(args.days - 1, horizon_days + 1)
+    growth = daily_kib[-1] / daily_kib[steady_day] - 1
+    report = {
+        "days": args.days,
+        "cars_per_day": args.cars,
+        "retention_horizon": args.retention_horizon,
+        "daily_kib": [round(kib) for kib in daily_kib],
+        "observations_held": sum(
+            len(held) for roads in server.plates.values() for held in roads.values()
+        ),
+        "growth_after_horizon": growth,
+        "ok": growth <= args.tolerance,
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
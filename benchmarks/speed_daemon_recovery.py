@@ -0,0 +1,103 @@
+"""Startup time benchmark for a journaled Speed Daemon server.
+
+Writes a snapshot holding most of the observations plus a journal tail, then
+times constructing a Server on that directory: loading the journal,
+interning plates, rebuilding the observation store and pruning it. Prints a
+JSON report.
+
+    python benchmarks/speed_daemon_recovery.py 10000000
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("PROTOHACKERS_LOG_LEVEL", "WARNING")
+
+from speed_daemon_journal import Journal  # noqa: E402
+
+speed_daemon = importlib.import_module("06_speed_daemon")
+
+# Fraction of the observations that end up in the journal tail rather than
+# the snapshot.
+TAIL_FRACTION = 0.1
+
+
+def build(directory: str, count: int) -> None:
+    journal = Journal(directory)
+    journal.recover()
+    snapshot_count = int(count * (1 - TAIL_FRACTION))
+    journal.start_snapshot(
+        (
+            (f"P{i % 100_000:06d}", i, i % 50, i % 7 * 10)
+            for i in range(snapshot_count)
+        ),
+        {f"P{i:06d}": {0, 1} for i in range(0, 100_000, 10)},
+    )
+    for i in range(snapshot_count, count):
+        journal.append_plate(f"P{i % 100_000:06d}", i, i % 50, i % 7 * 10)
+    journal.close()
+
+
+def peak_rss_kib() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "observations",
+        nargs="?",
+        type=int,
+        default=10_000_000,
+        help="how many to write",
+    )
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    count = args.observations
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        build(directory, count)
+        build_elapsed = time.perf_counter() - start
+        size = sum(path.stat().st_size for path in Path(directory).iterdir())
+
+        start = time.perf_counter()
+        server = speed_daemon.Server("127.0.0.1", 0, journal_dir=directory)
+        elapsed = time.perf_counter() - start
+        kept = sum(
+            len(observations)
+            for roads in server.plates.values()
+            for observations in roads.values()
+        )
+        server.close()
+
+    report = {
+        "observations": count,
+        "observations_kept": kept,
+        "on_disk_mib": size / 2**20,
+        "build_ms": build_elapsed * 1000,
+        "startup_ms": elapsed * 1000,
+        "observations_per_sec": count / elapsed,
+        "peak_rss_kib": peak_rss_kib(),
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Ticket throughput benchmark for the Speed Daemon.
+
+Runs the server in-process on a loopback port, has two cameras report a burst
+of speeding cars on one road and times how long a single dispatcher takes to
+receive every ticket. The number of outbound sendmsg calls is also reported.
+Prints a JSON report.
+
+    python benchmarks/speed_daemon_tickets.py --tickets 20000
+"""
+
+import argparse
+import importlib
+import json
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from protohackers import Transport  # noqa: E402
+from speed_daemon_codec import (  # noqa: E402
+    Decoder,
+    MessageType,
+    encode_camera,
+    encode_dispatcher,
+    encode_plate,
+)
+
+speed_daemon = importlib.import_module("06_speed_daemon")
+
+
+class CountingSocket:
+    """Stands in for a connection's socket, counting sendmsg calls."""
+
+    def __init__(self, sock: socket.socket, calls: list[int]) -> None:
+        self.sock = sock
+        self.calls = calls
+
+    def sendmsg(self, *args) -> int:
+        self.calls[0] += 1
+        return self.sock.sendmsg(*args)
+
+    def __getattr__(self, name: str):
+        return getattr(self.sock, name)
+
+
+def count_sendmsg_calls() -> list[int]:
+    calls = [0]
+    original_init = Transport.__init__
+
+    def counting_init(self, loop, sock, *args, **kwargs) -> None:
+        original_init(self, loop, CountingSocket(sock, calls), *args, **kwargs)
+
+    Transport.__init__ = counting_init
+    return calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=20_000)
+    parser.add_argument("--report", help="write the JSON report here, not stdout")
+    args = parser.parse_args()
+
+    server = speed_daemon.Server("127.0.0.1", 0)
+    port = server.sock.getsockname()[1]
+    threading.Thread(target=server.handle_connections, daemon=True).start()
+    calls = count_sendmsg_calls()
+
+    dispatcher = socket.create_connection(("127.0.0.1", port))
+    dispatcher.sendall(encode_dispatcher([1]))
+    camera1 = socket.create_connection(("127.0.0.1", port))
+    camera2 = socket.create_connection(("127.0.0.1", port))
+    camera1.sendall(encode_camera(1, 0, 60))
+    camera2.sendall(encode_camera(1, 10, 60))
+    time.sleep(0.2)
+
+    plates = [f"B{i:06d}" for i in range(args.tickets)]
+    start = time.perf_counter()
+    camera1.sendall(b"".join(encode_plate(plate, 0) for plate in plates))
+    camera2.sendall(b"".join(encode_plate(plate, 300) for plate in plates))
+
+    decoder = Decoder()
+    received = 0
+    while received < args.tickets:
+        decoder.feed(dispatcher.recv(65536))
+        while decoder.buffered():
+            # Tickets are server to client frames, so step over them by hand.
+            view = decoder.buffer
+            offset = decoder.offset
+            assert view[offset] == MessageType.TICKET
+            if decoder.buffered() < 2:
+                break
+            frame_len = 2 + view[offset + 1] + 16
+            if decoder.buffered() < frame_len:
+                break
+            decoder.offset += frame_len
+            received += 1
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "tickets": received,
+        "delivery_ms": elapsed * 1000,
+        "tickets_per_sec": received / elapsed,
+        "sendmsg_calls": calls[0],
+    }
+    output = json.dumps(report, indent=2)
+    if args.report:
+        Path(args.report).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Microbenchmarks for each solution's hot paths, run by pytest-benchmark.
+
+Every benchmark calls a core function directly, with no sockets involved.
+extra_info records how many items, like requests or lines, one call
+handles. Results can be saved as JSON and checked against an earlier run
+with benchmarks/compare.py:
+
+    python -m pytest benchmarks --benchmark-json=before.json
+    ... change something ...
+    python -m pytest benchmarks --benchmark-json=after.json
+    python benchmarks/compare.py before.json after.json
+
+Pass -k to pick benchmarks, e.g. -k speed_daemon.
+"""
+
+import importlib
+import os
+import struct
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# The solutions log from their hot paths; keep that out of the measurements.
+os.environ.setdefault("PROTOHACKERS_LOG_LEVEL", "ERROR")
+
+from protohackers import LineFramer, Metrics  # noqa: E402
+from speed_daemon_codec import Decoder, encode_plate  # noqa: E402
+
+prime_time = importlib.import_module("01_prime_time")
+means_to_an_end = importlib.import_module("02_means_to_an_end")
+budget_chat = importlib.import_module("03_budget_chat")
+unusual_database = importlib.import_module("04_unusual_database_program")
+mob_in_the_middle = importlib.import_module("05_mob_in_the_middle")
+speed_daemon = importlib.import_module("06_speed_daemon")
+
+
+class NullTransport:
+    """Stands in for a Transport, discarding whatever is written to it."""
+
+    def __init__(self) -> None:
+        self.metrics = Metrics()
+        self.bytes_sent = 0
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    def sendto(self, data: bytes, addr: object) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def is_closing(self) -> bool:
+        return False
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def get_extra_info(self, name: str) -> None:
+        return None
+
+
+def protocol(cls: type, *args: object) -> object:
+    instance = cls(*args)
+    instance.transport = NullTransport()
+    if hasattr(instance, "connection_made"):
+        instance.connection_made(instance.transport)
+    return instance
+
+
+def run(benchmark, function: Callable[[], object], items: int = 1) -> None:
+    benchmark.extra_info["items"] = items
+    benchmark(function)
+
+
+PRIME_TIME_REQUESTS = b'{"method":"isPrime","number":104729}\n' * 100
+
+
+@pytest.mark.parametrize("number", [104729, 1_000_000_007])
+def test_prime_time_is_prime(benchmark, number: int) -> None:
+    run(benchmark, lambda: prime_time.is_prime(number))
+
+
+def test_prime_time_data_received(benchmark) -> None:
+    def parse_requests() -> None:
+        protocol(prime_time.PrimeTimeProtocol).data_received(PRIME_TIME_REQUESTS)
+
+    run(benchmark, parse_requests, 100)
+
+
+MEANS_TO_AN_END_INSERTS = b"".join(
+    b"I" + struct.pack(">ii", i, i) for i in range(1000)
+)
+
+
+def test_means_to_an_end_query(benchmark) -> None:
+    session = protocol(means_to_an_end.PriceProtocol)
+    session.data_received(MEANS_TO_AN_END_INSERTS)
+    query = b"Q" + struct.pack(">ii", 0, 1000)
+    run(benchmark, lambda: session.query_message(query))
+
+
+def test_means_to_an_end_data_received(benchmark) -> None:
+    def parse_inserts() -> None:
+        protocol(means_to_an_end.PriceProtocol).data_received(
+            MEANS_TO_AN_END_INSERTS
+        )
+
+    run(benchmark, parse_inserts, 1000)
+
+
+def test_budget_chat_broadcast(benchmark) -> None:
+    server = budget_chat.Server("127.0.0.1", 0)
+    server.sock.close()
+    for i in range(10):
+        member = protocol(budget_chat.ChatProtocol, server)
+        member.data_received(f"member{i}\n".encode())
+    sender = protocol(budget_chat.ChatProtocol, server)
+    sender.data_received(b"sender\n")
+    lines = b"hello everybody, how is it going?\n" * 100
+    run(benchmark, lambda: sender.data_received(lines), 100)
+
+
+@pytest.mark.parametrize("datagram", [b"key=value", b"key"], ids=["insert", "query"])
+def test_unusual_database_datagram(benchmark, datagram: bytes) -> None:
+    database = unusual_database.DatabaseProtocol()
+    database.connection_made(NullTransport())
+    address = ("127.0.0.1", 1)
+    database.datagram_received(b"key=value", address)
+    run(benchmark, lambda: database.datagram_received(datagram, address))
+
+
+MOB_MESSAGE = (
+    "[alice] Send refunds to 7iKDZEwPZSqIvDnHvVN2r0hUWXD5rHX or "
+    "7LOrwbDlS8NujgjddyogWgIM93MV5N2VR please"
+)
+
+
+def test_mob_in_the_middle_rewrite(benchmark) -> None:
+    rewrite = mob_in_the_middle.RelayProtocol.rewrite_boguscoin_addresses
+    run(benchmark, lambda: rewrite(MOB_MESSAGE))
+
+
+def test_mob_in_the_middle_data_received(benchmark) -> None:
+    relay = protocol(mob_in_the_middle.RelayProtocol)
+    relay.peer = protocol(mob_in_the_middle.RelayProtocol)
+    lines = (MOB_MESSAGE + "\n").encode() * 100
+    run(benchmark, lambda: relay.data_received(lines), 100)
+
+
+@pytest.fixture
+def speed_daemon_server():
+    server = speed_daemon.Server("127.0.0.1", 0)
+    server.sock.close()
+    return server
+
+
+def test_speed_daemon_check_for_ticket(benchmark, speed_daemon_server) -> None:
+    # 50 sightings of one car, all within the limit, so checking never tickets.
+    for i in range(50):
+        speed_daemon_server.process_plate(
+            "CHECK1", i * 600, speed_daemon.Camera(0, 1, i, 60)
+        )
+    sighting = speed_daemon.Plate("CHECK1", 30_000, 1, 100)
+    run(benchmark, lambda: speed_daemon_server.check_for_ticket(sighting, 60))
+
+
+def test_speed_daemon_process_plate(benchmark, speed_daemon_server) -> None:
+    camera = speed_daemon.Camera(0, 1, 0, 60)
+    counter = iter(range(1 << 62))
+
+    def process_plate() -> None:
+        # Fresh plates and timestamps, so no ticket is ever due.
+        i = next(counter)
+        plate = speed_daemon_server.process_plate(f"P{i % 100_000}", i * 1000, camera)
+        speed_daemon_server.check_for_ticket(plate, camera.limit)
+
+    run(benchmark, process_plate)
+
+
+def test_speed_daemon_decoder(benchmark) -> None:
+    plates = b"".join(encode_plate(f"PL{i:05d}", i) for i in range(1000))
+
+    def decode_plates() -> None:
+        decoder = Decoder()
+        decoder.feed(plates)
+        while decoder.next_message() is not None:
+            pass
+
+    run(benchmark, decode_plates, 1000)
+
+
+def test_line_framer(benchmark) -> None:
+    lines = b'{"method":"isPrime","number":104729}\n' * 1000
+
+    def split_lines() -> None:
+        framer = LineFramer()
+        framer.feed(lines)
+        for _ in framer.lines():
+            pass
+
+    run(benchmark, split_lines, 1000)
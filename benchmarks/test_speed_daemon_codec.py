@@ -0,0 +1,94 @@
+"""Checks that the Speed Daemon Decoder copes with however a stream is split.
+
+A random stream of client messages is decoded in one piece and again split
+at random chunk boundaries, and both must give back exactly the messages
+that were encoded.
+"""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from speed_daemon_codec import (  # noqa: E402
+    Decoder,
+    MessageType,
+    encode_camera,
+    encode_dispatcher,
+    encode_plate,
+    encode_want_heartbeat,
+)
+
+PLATE_CHARACTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+def random_message(rng: random.Random) -> tuple[bytes, tuple]:
+    """Return an encoded message and what decoding it should give."""
+    kind = rng.randrange(10)
+    if kind == 0:
+        fields = (rng.randrange(65536), rng.randrange(65536), rng.randrange(65536))
+        return encode_camera(*fields), (MessageType.IAMCAMERA, fields)
+    if kind == 1:
+        roads = [rng.randrange(65536) for _ in range(rng.randrange(256))]
+        return encode_dispatcher(roads), (MessageType.IAMDISPATCHER, roads)
+    if kind == 2:
+        interval = rng.randrange(2**32)
+        return (
+            encode_want_heartbeat(interval),
+            (MessageType.WANTHEARTBEAT, interval),
+        )
+    plate = "".join(rng.choice(PLATE_CHARACTERS) for _ in range(rng.randrange(1, 12)))
+    timestamp = rng.randrange(2**32)
+    return encode_plate(plate, timestamp), (MessageType.PLATE, (plate, timestamp))
+
+
+def decode_all(chunks: list[bytes]) -> list:
+    decoder = Decoder()
+    messages = []
+    for chunk in chunks:
+        decoder.feed(chunk)
+        while (message := decoder.next_message()) is not None:
+            messages.append(message)
+    assert decoder.buffered() == 0
+    return messages
+
+
+def split_randomly(stream: bytes, rng: random.Random, max_chunk: int) -> list[bytes]:
+    chunks = []
+    idx = 0
+    while idx < len(stream):
+        size = rng.randint(1, max_chunk)
+        chunks.append(stream[idx : idx + size])
+        idx += size
+    return chunks
+
+
+@pytest.fixture(scope="module")
+def sample() -> tuple[bytes, list]:
+    rng = random.Random(0)
+    frames, expected = zip(*(random_message(rng) for _ in range(2_000)))
+    return b"".join(frames), list(expected)
+
+
+def test_decode_in_one_chunk(sample) -> None:
+    stream, expected = sample
+    assert decode_all([stream]) == expected
+
+
+@pytest.mark.parametrize("max_chunk", [1, 2, 3, 7, 64, 1024])
+def test_decode_split_at_random(sample, max_chunk: int) -> None:
+    stream, expected = sample
+    rng = random.Random(max_chunk)
+    for _ in range(10):
+        assert decode_all(split_randomly(stream, rng, max_chunk)) == expected
+
+
+@pytest.mark.parametrize("count", [0, 1, 255])
+def test_dispatcher_road_counts(count: int) -> None:
+    roads = list(range(1000, 1000 + count))
+    assert decode_all([encode_dispatcher(roads)]) == [
+        (MessageType.IAMDISPATCHER, roads)
+    ]
@@ -0,0 +1,34 @@
+from protohackers.framing import LineFramer, LineTooLong, compact_buffer
+from protohackers.instrumentation import Logger, Metrics, log
+from protohackers.loop import EventLoop, TimerHandle
+from protohackers.profiling import Profiler
+from protohackers.server import (
+    BaseServer,
+    DatagramProtocol,
+    DatagramTransport,
+    Protocol,
+    ServerOptions,
+    TCPServer,
+    Transport,
+    UDPServer,
+)
+
+__all__ = [
+    "BaseServer",
+    "DatagramProtocol",
+    "DatagramTransport",
+    "EventLoop",
+    "LineFramer",
+    "LineTooLong",
+    "Logger",
+    "Metrics",
+    "Profiler",
+    "Protocol",
+    "ServerOptions",
+    "TCPServer",
+    "TimerHandle",
+    "Transport",
+    "UDPServer",
+    "compact_buffer",
+    "log",
+]
@@ -0,0 +1,79 @@
+from collections.abc import Iterator
+
+# Only compact a buffer once this many consumed bytes have piled up, so
+# that a stream of short messages does not shift the buffer every time.
+COMPACT_THRESHOLD = 4096
+
+DEFAULT_MAX_LINE_LENGTH = 65536
+
+
+class LineTooLong(Exception):
+    pass
+
+
+def compact_buffer(buffer: bytearray, consumed: int) -> int:
+    """Drop the first consumed bytes of buffer if that is worth doing now.
+
+    For buffers read by advancing an offset rather than deleting what has
+    been read. A fully consumed buffer is always emptied; otherwise the
+    consumed bytes go once they pass COMPACT_THRESHOLD and make up at least
+    half the buffer, so the copy is paid for by the reads that came before
+    it. Returns how many bytes were dropped, to take off the offsets.
+    """
+    if consumed == len(buffer):
+        buffer.clear()
+        return consumed
+    if consumed >= COMPACT_THRESHOLD and consumed * 2 >= len(buffer):
+        del buffer[:consumed]
+        return consumed
+    return 0
+
+
+class LineFramer:
+    """Incremental splitter for newline terminated byte streams.
+
+    Received bytes are appended to a bytearray. Complete lines are found with
+    find, starting where the previous search stopped, so a burst of many lines
+    is scanned once rather than once per line. Lines are returned as bytes
+    without their newline. Decoding whole lines means a UTF-8 character split
+    across two reads is whole again by the time it is decoded.
+
+    LineTooLong is raised once more than max_line_length bytes are buffered
+    without a newline, so a peer cannot make the buffer grow without bound.
+    """
+
+    def __init__(self, max_line_length: int = DEFAULT_MAX_LINE_LENGTH) -> None:
+        self.max_line_length = max_line_length
+        self.buffer = bytearray()
+        # Start of the next line, and where to resume searching for its end.
+        self.start = 0
+        self.scan = 0
+
+    def feed(self, data: bytes) -> None:
+        dropped = compact_buffer(self.buffer, self.start)
+        self.start -= dropped
+        self.scan -= dropped
+        self.buffer += data
+
+    def buffered(self) -> int:
+        return len(self.buffer) - self.start
+
+    def next_line(self) -> bytes | None:
+        buffer = self.buffer
+        start = self.start
+        end = buffer.find(b"\n", self.scan)
+        if end == -1:
+            self.scan = len(buffer)
+            if self.scan - start > self.max_line_length:
+                raise LineTooLong(f"No newline in {self.scan - start} bytes")
+            return None
+        if end - start > self.max_line_length:
+            raise LineTooLong(f"Line of {end - start} bytes")
+        with memoryview(buffer) as view:
+            line = view[start:end].tobytes()
+        self.start = self.scan = end + 1
+        return line
+
+    def lines(self) -> Iterator[bytes]:
+        while (line := self.next_line()) is not None:
+            yield line
@@ -0,0 +1,279 @@
+import atexit
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from typing import Any, TextIO
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# Records queued beyond this are dropped, so a flood of log lines costs
+# memory only up to a point.
+MAX_PENDING_RECORDS = 100_000
+
+# How long the writer thread lets records pile up before writing them, so a
+# busy server wakes it a few times a second rather than once per record.
+WRITE_INTERVAL = 0.1
+
+# Bucket i counts observations below 2**i microseconds; the last bucket also
+# takes everything slower.
+HISTOGRAM_BUCKETS = 32
+
+
+class Logger:
+    """Log writer that keeps stream I/O off the threads serving clients.
+
+    Callers only put the message and its arguments on a queue. A background
+    thread does the formatting and writing, in batches. Records can be
+    sampled by passing sample, the fraction of calls to keep.
+    """
+
+    def __init__(self, level: int = INFO, stream: TextIO | None = None) -> None:
+        self.level = level
+        # None means whatever sys.stdout is when the record is written.
+        self.stream = stream
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        # Set when records are queued. Records stay on the queue until they
+        # are written, so flush can always reach them.
+        self.wakeup = threading.Event()
+        self.dropped = 0
+        self.thread: threading.Thread | None = None
+        self.thread_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def log(self, level: int, message: str, *args: Any, sample: float = 1.0) -> None:
+        if level < self.level:
+            return
+        if sample < 1.0 and random.random() >= sample:
+            return
+        if self.queue.qsize() >= MAX_PENDING_RECORDS:
+            self.dropped += 1
+            return
+        self.queue.put((time.time(), level, message, args))
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+        if self.thread is None:
+            self.start()
+
+    def debug(self, message: str, *args: Any, sample: float = 1.0) -> None:
+        self.log(DEBUG, message, *args, sample=sample)
+
+    def info(self, message: str, *args: Any, sample: float = 1.0) -> None:
+        self.log(INFO, message, *args, sample=sample)
+
+    def warning(self, message: str, *args: Any, sample: float = 1.0) -> None:
+        self.log(WARNING, message, *args, sample=sample)
+
+    def error(self, message: str, *args: Any, sample: float = 1.0) -> None:
+        self.log(ERROR, message, *args, sample=sample)
+
+    def exception(self, message: str, *args: Any) -> None:
+        """Log an ERROR with the traceback of the exception being handled."""
+        self.log(ERROR, "%s\n%s", message % args, traceback.format_exc().rstrip())
+
+    def start(self) -> None:
+        with self.thread_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait()
+            time.sleep(WRITE_INTERVAL)
+            # Cleared before draining, so anything queued after the drain
+            # starts another round.
+            self.wakeup.clear()
+            self.write()
+
+    def write(self) -> None:
+        with self.write_lock:
+            records = []
+            try:
+                while True:
+                    records.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if records or self.dropped:
+                self.write_records(records)
+
+    def write_records(self, records: list[tuple]) -> None:
+        lines = []
+        for timestamp, level, message, args in records:
+            if args:
+                try:
+                    message = message % args
+                except (TypeError, ValueError) as e:
+                    message = f"{message} {args} (formatting failed: {e})"
+            clock = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            milliseconds = int(timestamp * 1000) % 1000
+            lines.append(f"{clock}.{milliseconds:03d} {LEVEL_NAMES[level]} {message}\n")
+        if self.dropped:
+            lines.append(f"{self.dropped} log records dropped\n")
+            self.dropped = 0
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("".join(lines))
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def flush(self) -> None:
+        """Write out everything logged so far from the calling thread."""
+        self.write()
+
+
+def level_from_environment() -> int:
+    name = os.environ.get("PROTOHACKERS_LOG_LEVEL", "INFO").upper()
+    return LEVELS.get(name, INFO)
+
+
+log = Logger(level_from_environment())
+atexit.register(log.flush)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        bucket = int(seconds * 1_000_000).bit_length()
+        self.counts[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def merge(self, other: "Histogram") -> None:
+        for bucket, count in enumerate(list(other.counts)):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound, in seconds, of the bucket holding the given fraction."""
+        threshold = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min((1 << bucket) / 1_000_000, self.maximum)
+        return self.maximum
+
+    def summary(self) -> dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.maximum * 1000,
+        }
+
+
+class MetricsShard:
+    __slots__ = ("counters", "gauges", "histograms")
+
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+
+class Timed:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Metrics:
+    """Counters and latency histograms that any thread can update cheaply.
+
+    Every thread updates a shard of its own, so updates take no lock and
+    snapshot adds the shards together. A snapshot taken while other threads
+    are busy may be a few updates behind, which is fine for monitoring.
+    Counters may go down as well as up. Gauges hold the last value set by
+    each thread, and are added together across threads.
+    """
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+        self.shards: list[MetricsShard] = []
+        self.shards_lock = threading.Lock()
+        self.started = time.time()
+
+    def shard(self) -> MetricsShard:
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = MetricsShard()
+            with self.shards_lock:
+                self.shards.append(shard)
+            return shard
+
+    def increment(self, name: str, value: int = 1) -> None:
+        counters = self.shard().counters
+        counters[name] = counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self.shard().gauges[name] = value
+
+    def histogram(self, name: str) -> Histogram:
+        histograms = self.shard().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        return histogram
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).observe(seconds)
+
+    def timed(self, name: str) -> Timed:
+        """Context manager that records how long its block takes under name."""
+        return Timed(self.histogram(name))
+
+    def snapshot(self) -> dict[str, Any]:
+        counters: dict[str, int] = {}
+        gauges: dict[str, float] = {}
+        histograms: dict[str, Histogram] = {}
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for name, value in dict(shard.counters).items():
+                counters[name] = counters.get(name, 0) + value
+            for name, value in dict(shard.gauges).items():
+                gauges[name] = gauges.get(name, 0) + value
+            for name, histogram in dict(shard.histograms).items():
+                histograms.setdefault(name, Histogram()).merge(histogram)
+        return {
+            "uptime": time.time() - self.started,
+            "counters": dict(sorted(counters.items())),
+            "gauges": dict(sorted(gauges.items())),
+            "latency": {
+                name: histograms[name].summary() for name in sorted(histograms)
+            },
+        }
@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+from protohackers.instrumentation import log
+
+# The timer heap is rebuilt without its cancelled timers once there are more
+# than this many of them and they make up over half the heap.
+MIN_CANCELLED_TIMERS_FOR_CLEANUP = 100
+
+
+class TimerHandle:
+    __slots__ = ("when", "sequence", "callback", "args", "cancelled", "loop")
+
+    def __init__(
+        self,
+        when: float,
+        sequence: int,
+        callback: Callable[..., Any],
+        args: tuple,
+        loop: "EventLoop | None" = None,
+    ) -> None:
+        self.when = when
+        self.sequence = sequence
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        # The loop whose heap holds this timer, until it is popped.
+        self.loop = loop
+
+    def __lt__(self, other: "TimerHandle") -> bool:
+        return (self.when, self.sequence) < (other.when, other.sequence)
+
+    def cancel(self) -> None:
+        if self.cancelled:
+            return
+        self.cancelled = True
+        # Let go of whatever the callback holds on to now, rather than once
+        # the timer works its way to the top of the heap.
+        self.callback = None
+        self.args = ()
+        if self.loop is not None:
+            self.loop.cancelled_timers += 1
+
+
+class EventLoop:
+    """A minimal selectors based event loop.
+
+    Everything except call_soon_threadsafe and stop must be called from the
+    thread running the loop. Timers live in a heap. Cancelled ones are
+    discarded when they reach the top, or all at once when they make up most
+    of the heap.
+    """
+
+    def __init__(self) -> None:
+        self.selector = selectors.DefaultSelector()
+        self.ready: deque[tuple[Callable[..., Any], tuple]] = deque()
+        self.timers: list[TimerHandle] = []
+        self.cancelled_timers = 0
+        self.sequence = itertools.count()
+        self.threadsafe_callbacks: deque[tuple[Callable[..., Any], tuple]] = deque()
+        self.threadsafe_lock = threading.Lock()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.add_reader(self.wakeup_reader, self.drain_wakeup)
+        self.end_of_iteration: list[Callable[[], None]] = []
+        self.thread_id: int | None = None
+        self.stopping = False
+        # Seconds spent waiting in select, for working out how busy the loop is.
+        self.idle_time = 0.0
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    def is_running(self) -> bool:
+        return self.thread_id is not None
+
+    def in_loop_thread(self) -> bool:
+        return self.thread_id == threading.get_ident()
+
+    def call_soon(self, callback: Callable[..., Any], *args: Any) -> None:
+        self.ready.append((callback, args))
+
+    def call_soon_threadsafe(self, callback: Callable[..., Any], *args: Any) -> None:
+        with self.threadsafe_lock:
+            self.threadsafe_callbacks.append((callback, args))
+        self.wakeup()
+
+    def call_later(
+        self, delay: float, callback: Callable[..., Any], *args: Any
+    ) -> TimerHandle:
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def call_at(
+        self, when: float, callback: Callable[..., Any], *args: Any
+    ) -> TimerHandle:
+        timer = TimerHandle(when, next(self.sequence), callback, args, self)
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def call_at_end_of_iteration(self, callback: Callable[[], None]) -> None:
+        """Run callback once after the current batch of events is handled.
+
+        Used to coalesce many small writes into one flush.
+        """
+        self.end_of_iteration.append(callback)
+
+    def wakeup(self) -> None:
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def drain_wakeup(self) -> None:
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _update(
+        self, fileobj: Any, reader: Callable | None, writer: Callable | None
+    ) -> None:
+        events = (selectors.EVENT_READ if reader else 0) | (
+            selectors.EVENT_WRITE if writer else 0
+        )
+        try:
+            key = self.selector.get_key(fileobj)
+        except KeyError:
+            if events:
+                self.selector.register(fileobj, events, (reader, writer))
+            return
+        if events:
+            self.selector.modify(fileobj, events, (reader, writer))
+        else:
+            self.selector.unregister(fileobj)
+
+    def _callbacks(self, fileobj: Any) -> tuple[Callable | None, Callable | None]:
+        try:
+            return self.selector.get_key(fileobj).data
+        except KeyError:
+            return None, None
+
+    def add_reader(self, fileobj: Any, callback: Callable[[], None]) -> None:
+        self._update(fileobj, callback, self._callbacks(fileobj)[1])
+
+    def remove_reader(self, fileobj: Any) -> None:
+        self._update(fileobj, None, self._callbacks(fileobj)[1])
+
+    def add_writer(self, fileobj: Any, callback: Callable[[], None]) -> None:
+        self._update(fileobj, self._callbacks(fileobj)[0], callback)
+
+    def remove_writer(self, fileobj: Any) -> None:
+        self._update(fileobj, self._callbacks(fileobj)[0], None)
+
+    def remove(self, fileobj: Any) -> None:
+        self._update(fileobj, None, None)
+
+    def stop(self) -> None:
+        if self.in_loop_thread():
+            self.stopping = True
+        else:
+            self.call_soon_threadsafe(self.stop)
+
+    def run_forever(self) -> None:
+        self.thread_id = threading.get_ident()
+        self.stopping = False
+        try:
+            while not self.stopping:
+                self.run_once()
+        finally:
+            self.thread_id = None
+
+    def remove_cancelled_timers(self) -> None:
+        timers = []
+        for timer in self.timers:
+            if timer.cancelled:
+                timer.loop = None
+            else:
+                timers.append(timer)
+        heapq.heapify(timers)
+        self.timers = timers
+        self.cancelled_timers = 0
+
+    def run_once(self) -> None:
+        if (
+            self.cancelled_timers > MIN_CANCELLED_TIMERS_FOR_CLEANUP
+            and self.cancelled_timers * 2 > len(self.timers)
+        ):
+            self.remove_cancelled_timers()
+        timeout = None
+        if self.ready or self.threadsafe_callbacks or self.end_of_iteration:
+            timeout = 0
+        elif self.timers:
+            timeout = max(0, self.timers[0].when - self.time())
+        select_started = self.time()
+        events = self.selector.select(timeout)
+        now = self.time()
+        self.idle_time += now - select_started
+        for key, mask in events:
+            reader, writer = key.data
+            if mask & selectors.EVENT_READ and reader is not None:
+                self.ready.append((reader, ()))
+            if mask & selectors.EVENT_WRITE and writer is not None:
+                self.ready.append((writer, ()))
+
+        while self.timers and (self.timers[0].cancelled or self.timers[0].when <= now):
+            timer = heapq.heappop(self.timers)
+            timer.loop = None
+            if timer.cancelled:
+                self.cancelled_timers -= 1
+            else:
+                self.ready.append((timer.callback, timer.args))
+
+        if self.threadsafe_callbacks:
+            with self.threadsafe_lock:
+                self.ready.extend(self.threadsafe_callbacks)
+                self.threadsafe_callbacks.clear()
+
+        for _ in range(len(self.ready)):
+            callback, args = self.ready.popleft()
+            self.run_callback(callback, *args)
+
+        while self.end_of_iteration:
+            callbacks, self.end_of_iteration = self.end_of_iteration, []
+            for callback in callbacks:
+                self.run_callback(callback)
+
+    @staticmethod
+    def run_callback(callback: Callable[..., Any], *args: Any) -> None:
+        # One misbehaving callback must not take every connection down with it.
+        try:
+            callback(*args)
+        except Exception:
+            log.exception("Unhandled error in %r", callback)
+
+    def close(self) -> None:
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
@@ -0,0 +1,102 @@
+import cProfile
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+from protohackers.instrumentation import log
+from protohackers.loop import EventLoop, TimerHandle
+
+# From Python 3.12 cProfile is built on sys.monitoring, which allows one
+# profiler per process and sees every thread.
+SHARED_PROFILE = sys.version_info >= (3, 12)
+
+
+class Profiler:
+    """cProfile capture for a server's loops, switched on and off by a signal.
+
+    Before Python 3.12 cProfile only sees the thread that enabled it, so
+    each loop runs its own profile. While capture is on, every interval
+    seconds each loop writes what it has collected to
+    directory/profile-<pid>-loop<index>-<sequence>.pstats and starts afresh.
+    From 3.12 a single profile run from the first loop covers them all and
+    is written to directory/profile-<pid>-loops-<sequence>.pstats instead.
+    Switching capture off writes out the last partial interval.
+    """
+
+    def __init__(
+        self, loops: list[EventLoop], directory: str | Path, interval: float = 10.0
+    ) -> None:
+        self.loops = loops
+        self.directory = Path(directory)
+        self.interval = interval
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.profiles: dict[int, cProfile.Profile] = {}
+        self.timers: dict[int, TimerHandle] = {}
+        self.sequence = 0
+
+    def install(self, signum: int = signal.SIGUSR1) -> None:
+        """Toggle capture whenever signum arrives. Must run on the main thread."""
+        signal.signal(signum, self.handle_signal)
+        log.info(
+            "Send signal %d to pid %d to toggle profiling into %s",
+            signum,
+            os.getpid(),
+            self.directory,
+        )
+
+    def handle_signal(self, signum: int, frame: object) -> None:
+        # The handler can interrupt the main loop while it holds the lock
+        # call_soon_threadsafe takes, so hand the work to another thread.
+        threading.Thread(target=self.toggle, daemon=True).start()
+
+    def toggle(self) -> None:
+        with self.lock:
+            self.enabled = not self.enabled
+            if self.enabled:
+                self.directory.mkdir(parents=True, exist_ok=True)
+            log.info("Profiling %s", "started" if self.enabled else "stopped")
+            loops = self.loops[:1] if SHARED_PROFILE else self.loops
+            for index, loop in enumerate(loops):
+                callback = self.start_loop if self.enabled else self.stop_loop
+                loop.call_soon_threadsafe(callback, index)
+
+    def start_loop(self, index: int) -> None:
+        if index in self.profiles:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Some other profiler or debugger already has the process.
+            log.warning("Could not start profiling: %s", e)
+            return
+        self.profiles[index] = profile
+        self.timers[index] = self.loops[index].call_later(
+            self.interval, self.rotate, index
+        )
+
+    def rotate(self, index: int) -> None:
+        self.stop_loop(index)
+        self.start_loop(index)
+
+    def stop_loop(self, index: int) -> None:
+        profile = self.profiles.pop(index, None)
+        if profile is None:
+            return
+        profile.disable()
+        self.timers.pop(index).cancel()
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+        label = "loops" if SHARED_PROFILE else f"loop{index}"
+        name = f"profile-{os.getpid()}-{label}-{sequence:04d}.pstats"
+        path = self.directory / name
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            log.warning("Could not write %s: %s", path, e)
+            return
+        log.info("Wrote %s", path)
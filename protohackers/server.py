@@ -0,0 +1,886 @@
+import errno
+import os
+import socket
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from protohackers.instrumentation import Metrics, log
+from protohackers.loop import EventLoop, TimerHandle
+from protohackers.profiling import Profiler
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+# How often each loop records how busy it is.
+SAMPLE_INTERVAL = 1.0
+
+# Connections allowed open at once unless PROTOHACKERS_MAX_CONNECTIONS says
+# otherwise, where 0 means no limit.
+DEFAULT_MAX_CONNECTIONS = 1024
+
+# How often a full server that may evict idle connections looks for one.
+EVICTION_CHECK_INTERVAL = 0.5
+
+
+def int_from_environment(name: str) -> int | None:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def stats_port_from_environment() -> int | None:
+    return int_from_environment("PROTOHACKERS_STATS_PORT")
+
+
+def max_connections_from_environment() -> int | None:
+    limit = int_from_environment("PROTOHACKERS_MAX_CONNECTIONS")
+    if limit is None:
+        return DEFAULT_MAX_CONNECTIONS
+    return limit or None
+
+
+def profile_dir_from_environment() -> str | None:
+    return os.environ.get("PROTOHACKERS_PROFILE_DIR") or None
+
+
+@dataclass
+class ServerOptions:
+    backlog: int = 128
+    recv_size: int = 65536
+    send_buffer_size: int | None = None
+    receive_buffer_size: int | None = None
+    nodelay: bool = False
+    reuse_address: bool = True
+    # Connections that neither send nor receive anything for this many
+    # seconds are closed. None disables the timeout.
+    idle_timeout: float | None = None
+    # Event loops, each in its own thread, that accepted connections are
+    # spread over. With 1 the accepting loop serves every connection itself.
+    # Only protocols that share no state between connections may use more.
+    workers: int = 1
+    # Accepted connections allowed open at once. Past it, new connections
+    # wait in the listen backlog, or are closed straight away if
+    # reject_when_full is set. None means no limit.
+    max_connections: int | None = field(
+        default_factory=max_connections_from_environment
+    )
+    reject_when_full: bool = False
+    # While max_connections are open, a connection that has been idle for at
+    # least this many seconds is closed to make room for a new one, the
+    # longest idle first. None never evicts, for protocols whose clients may
+    # legitimately sit quiet.
+    evict_idle_after: float | None = None
+    # Bytes per second each connection may send before reading from it is
+    # paused for a while. None means no limit.
+    max_read_rate: int | None = None
+    # Reading from a connection pauses while more than this many bytes are
+    # waiting to be sent to it, so a peer that does not read cannot make the
+    # write buffer grow without bound.
+    write_buffer_limit: int = 1 << 20
+    # How long close waits for connections to flush what they have queued.
+    shutdown_grace: float = 1.0
+    # Serve a JSON snapshot of the server's metrics to anyone connecting to
+    # this port on 127.0.0.1. None disables it.
+    stats_port: int | None = field(default_factory=stats_port_from_environment)
+    # Where SIGUSR1 toggled cProfile captures are written, one pstats file
+    # per loop every profile_interval seconds. None disables the signal.
+    profile_dir: str | None = field(default_factory=profile_dir_from_environment)
+    profile_interval: float = 10.0
+    # Extra (level, option, value) tuples passed to setsockopt.
+    socket_options: list[tuple[int, int, int]] = field(default_factory=list)
+
+    def apply(self, sock: socket.socket) -> None:
+        if self.send_buffer_size is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size)
+        if self.receive_buffer_size is not None:
+            sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer_size
+            )
+        for level, option, value in self.socket_options:
+            sock.setsockopt(level, option, value)
+
+
+class Protocol:
+    """Per-connection handler. Subclasses override the callbacks they need.
+
+    The transport attribute is set before connection_made is called.
+    """
+
+    transport: "Transport"
+
+    def connection_made(self, transport: "Transport") -> None:
+        pass
+
+    def data_received(self, data: bytes) -> None:
+        pass
+
+    def eof_received(self) -> None:
+        """Called when the peer shuts down its side. Closes by default."""
+        self.transport.close()
+
+    def data_sent(self) -> None:
+        """Called after a flush hands some of what was written to the kernel."""
+        pass
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        pass
+
+
+class DatagramProtocol:
+    def connection_made(self, transport: "DatagramTransport") -> None:
+        pass
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        pass
+
+
+class Transport:
+    """A non-blocking stream socket driven by an EventLoop.
+
+    Writes are queued and flushed once per loop iteration with a single
+    vectored sendmsg call, so a burst of small frames costs one syscall.
+    write is safe to call from any thread.
+    """
+
+    def __init__(
+        self,
+        loop: EventLoop,
+        sock: socket.socket,
+        protocol: Protocol,
+        options: ServerOptions,
+        on_close: Callable[["Transport"], None] | None = None,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.loop = loop
+        self.sock = sock
+        self.protocol = protocol
+        self.options = options
+        self.on_close = on_close
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.frames: list[bytes] = []
+        self.buffer_size = 0
+        # Bytes handed to the kernel so far. Together with buffer_size it
+        # tells a caller whether what it wrote has gone out yet.
+        self.bytes_sent = 0
+        self.flush_scheduled = False
+        self.writing = False
+        self.reading = False
+        # Reasons reading may be paused: the protocol asked, the peer sent
+        # EOF, it is over its read rate, or it is not reading what we send.
+        self.protocol_paused = False
+        self.eof = False
+        self.throttled = False
+        self.backlogged = False
+        self.read_allowance = float(options.max_read_rate or 0)
+        self.read_checked = loop.time()
+        self.closing = False
+        self.closed = False
+        self.connected = False
+        self.peername: Any = None
+        self.last_activity = loop.time()
+        self.idle_timeout = options.idle_timeout
+        self.idle_timer: TimerHandle | None = None
+        sock.setblocking(False)
+
+    def start(self) -> None:
+        self.connected = True
+        try:
+            self.peername = self.sock.getpeername()
+        except OSError:
+            pass
+        self.protocol.transport = self
+        self.run_protocol(self.protocol.connection_made, self)
+        if self.closed:
+            return
+        self.update_reading()
+        self.set_idle_timeout(self.idle_timeout)
+        if self.frames:
+            self.schedule_flush()
+
+    def connect(self, address: tuple[str, int]) -> None:
+        """Start a non-blocking connect; start is called once it completes."""
+        self.protocol.transport = self
+        error = self.sock.connect_ex(address)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.force_close(OSError(error, os.strerror(error)))
+            return
+        self.writing = True
+        self.loop.add_writer(self.sock, self.connect_completed)
+
+    def connect_completed(self) -> None:
+        if self.closed:
+            return
+        self.writing = False
+        self.loop.remove_writer(self.sock)
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.force_close(OSError(error, os.strerror(error)))
+            return
+        self.start()
+
+    def get_extra_info(self, name: str) -> Any:
+        if name == "peername":
+            return self.peername
+        if name == "socket":
+            return self.sock
+        return None
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffer_size
+
+    def is_closing(self) -> bool:
+        return self.closing or self.closed
+
+    def run_protocol(self, callback: Callable[..., Any], *args: Any) -> None:
+        try:
+            callback(*args)
+        except Exception as e:
+            log.exception(
+                "Error in %s, closing connection", type(self.protocol).__name__
+            )
+            self.force_close(e)
+
+    def pause_reading(self) -> None:
+        self.protocol_paused = True
+        self.update_reading()
+
+    def resume_reading(self) -> None:
+        self.protocol_paused = False
+        self.update_reading()
+
+    def update_reading(self) -> None:
+        wanted = self.connected and not (
+            self.closing
+            or self.protocol_paused
+            or self.eof
+            or self.throttled
+            or self.backlogged
+        )
+        if wanted and not self.reading:
+            self.reading = True
+            self.loop.add_reader(self.sock, self.read_ready)
+        elif not wanted and self.reading:
+            self.reading = False
+            self.loop.remove_reader(self.sock)
+
+    def throttle_reading(self, size: int) -> None:
+        """Charge size bytes against the read rate, pausing if it is used up.
+
+        The allowance refills at max_read_rate bytes a second and can bank
+        at most one second's worth.
+        """
+        rate = self.options.max_read_rate
+        now = self.loop.time()
+        self.read_allowance = min(
+            rate, self.read_allowance + (now - self.read_checked) * rate
+        )
+        self.read_allowance -= size
+        self.read_checked = now
+        if self.read_allowance < 0:
+            self.throttled = True
+            self.update_reading()
+            self.metrics.increment("reads_throttled")
+            self.loop.call_later(-self.read_allowance / rate, self.end_throttle)
+
+    def end_throttle(self) -> None:
+        self.throttled = False
+        self.update_reading()
+
+    def read_ready(self) -> None:
+        if not self.reading:
+            return
+        try:
+            data = self.sock.recv(self.options.recv_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.force_close(e)
+            return
+        self.last_activity = self.loop.time()
+        self.metrics.increment("bytes_in", len(data))
+        if not data:
+            self.eof = True
+            self.update_reading()
+            self.run_protocol(self.protocol.eof_received)
+            return
+        if self.options.max_read_rate is not None:
+            self.throttle_reading(len(data))
+        self.run_protocol(self.protocol.data_received, data)
+
+    def set_idle_timeout(self, timeout: float | None) -> None:
+        """Change this connection's idle timeout. None disables it."""
+        self.idle_timeout = timeout
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if timeout is not None and self.connected and not self.closed:
+            self.idle_timer = self.loop.call_at(
+                self.last_activity + timeout, self.check_idle
+            )
+
+    def check_idle(self) -> None:
+        if self.closed or self.idle_timeout is None:
+            return
+        deadline = self.last_activity + self.idle_timeout
+        if self.loop.time() >= deadline:
+            self.force_close(TimeoutError("Connection timed out"))
+        else:
+            self.idle_timer = self.loop.call_at(deadline, self.check_idle)
+
+    def write(self, data: bytes) -> None:
+        if not self.loop.in_loop_thread() and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.write, data)
+            return
+        if self.closing or self.closed or not data:
+            return
+        self.frames.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size > self.options.write_buffer_limit and not self.backlogged:
+            self.backlogged = True
+            self.update_reading()
+        self.schedule_flush()
+
+    def writelines(self, frames: list[bytes]) -> None:
+        for frame in frames:
+            self.write(frame)
+
+    def schedule_flush(self) -> None:
+        if self.flush_scheduled or self.writing or not self.connected:
+            return
+        self.flush_scheduled = True
+        self.loop.call_at_end_of_iteration(self.flush)
+
+    def flush(self) -> None:
+        self.flush_scheduled = False
+        if self.closed:
+            return
+        bytes_sent = self.bytes_sent
+        try:
+            while self.frames:
+                sent = self.sock.sendmsg(self.frames[:IOV_MAX])
+                self.consume(sent)
+                self.metrics.increment("bytes_out", sent)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            self.force_close(e)
+            return
+        if self.bytes_sent != bytes_sent:
+            self.run_protocol(self.protocol.data_sent)
+            if self.closed:
+                return
+        self.last_activity = self.loop.time()
+        if self.frames and not self.writing:
+            self.writing = True
+            self.loop.add_writer(self.sock, self.write_ready)
+        elif not self.frames and self.writing:
+            self.writing = False
+            self.loop.remove_writer(self.sock)
+        backlogged = self.buffer_size > self.options.write_buffer_limit
+        if backlogged != self.backlogged:
+            self.backlogged = backlogged
+            self.update_reading()
+        if not self.frames and self.closing:
+            self.force_close(None)
+
+    def write_ready(self) -> None:
+        if self.writing:
+            self.flush()
+
+    def consume(self, sent: int) -> None:
+        self.buffer_size -= sent
+        self.bytes_sent += sent
+        frames = self.frames
+        idx = 0
+        while idx < len(frames) and sent >= len(frames[idx]):
+            sent -= len(frames[idx])
+            idx += 1
+        del frames[:idx]
+        if sent:
+            frames[0] = frames[0][sent:]
+
+    def close(self) -> None:
+        """Close once everything queued has been written. Safe from any thread."""
+        if not self.loop.in_loop_thread() and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.close)
+            return
+        if self.closing or self.closed:
+            return
+        self.closing = True
+        self.update_reading()
+        if self.frames and self.connected:
+            self.schedule_flush()
+        else:
+            self.force_close(None)
+
+    def abort(self) -> None:
+        if not self.loop.in_loop_thread() and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.abort)
+            return
+        self.force_close(None)
+
+    def force_close(self, exc: Exception | None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.closing = True
+        self.reading = self.writing = False
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        self.loop.remove(self.sock)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.frames.clear()
+        self.buffer_size = 0
+        if self.on_close is not None:
+            self.on_close(self)
+        self.loop.call_soon(self.run_protocol_lost, exc)
+
+    def run_protocol_lost(self, exc: Exception | None) -> None:
+        try:
+            self.protocol.connection_lost(exc)
+        except Exception:
+            log.exception("Error in %s.connection_lost", type(self.protocol).__name__)
+
+
+class StatsProtocol(Protocol):
+    """Writes a JSON snapshot of metrics and closes."""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+
+    def connection_made(self, transport: Transport) -> None:
+        transport.write(json.dumps(self.metrics.snapshot(), indent=2).encode() + b"\n")
+        transport.close()
+
+
+class DatagramTransport:
+    def __init__(
+        self,
+        loop: EventLoop,
+        sock: socket.socket,
+        options: ServerOptions,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.loop = loop
+        self.sock = sock
+        self.options = options
+        self.metrics = metrics if metrics is not None else Metrics()
+        sock.setblocking(False)
+
+    def sendto(self, data: bytes, addr: Any) -> None:
+        if not self.loop.in_loop_thread() and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.sendto, data, addr)
+            return
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            # UDP makes no delivery promises, so drop rather than queue.
+            self.metrics.increment("datagrams_dropped")
+            return
+        self.metrics.increment("bytes_out", len(data))
+
+
+class BaseServer:
+    """Shared lifecycle for servers driven by an EventLoop.
+
+    handle_connections runs the loop until close is called. close may be
+    called from another thread, from a callback, or after handle_connections
+    has been interrupted, and waits up to options.shutdown_grace seconds for
+    queued output to be flushed.
+    """
+
+    def __init__(
+        self, sock: socket.socket, options: ServerOptions, loop: EventLoop | None
+    ) -> None:
+        self.sock = sock
+        self.options = options
+        self.loop = loop or EventLoop()
+        # Loops that serve connections. Unless there are several workers the
+        # loop that accepts connections serves them too.
+        self.workers = [self.loop]
+        self.shutting_down = False
+        self.closed = threading.Event()
+        self.metrics = Metrics()
+        self.stats_sock: socket.socket | None = None
+        if options.stats_port is not None:
+            self.start_stats(options.stats_port)
+
+    def start_stats(self, port: int) -> None:
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", port))
+        sock.listen()
+        sock.setblocking(False)
+        self.stats_sock = sock
+        self.loop.add_reader(sock, self.stats_ready)
+        log.info("Serving stats on 127.0.0.1:%d", sock.getsockname()[1])
+
+    def stats_ready(self) -> None:
+        try:
+            conn, _ = self.stats_sock.accept()
+        except OSError:
+            return
+        Transport(self.loop, conn, StatsProtocol(self.metrics), ServerOptions()).start()
+
+    def handle_connections(self) -> None:
+        loops = self.all_loops()
+        for index, loop in enumerate(loops):
+            loop.call_later(
+                SAMPLE_INTERVAL, self.sample_load, index, loop.time(), loop.idle_time
+            )
+        if self.options.profile_dir is not None:
+            self.install_profiler(loops)
+        for index, loop in enumerate(loops):
+            if loop is not self.loop and not loop.is_running():
+                threading.Thread(
+                    target=loop.run_forever, name=f"worker-{index}", daemon=True
+                ).start()
+        self.loop.run_forever()
+
+    def install_profiler(self, loops: list[EventLoop]) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            log.warning("Profiling needs the server to run on the main thread")
+            return
+        Profiler(
+            loops, self.options.profile_dir, self.options.profile_interval
+        ).install()
+
+    def all_loops(self) -> list[EventLoop]:
+        return [self.loop] + [loop for loop in self.workers if loop is not self.loop]
+
+    def sample_load(self, index: int, started: float, idle_time: float) -> None:
+        """Record how busy loop index has been and how late its timers run."""
+        loop = self.all_loops()[index]
+        now = loop.time()
+        elapsed = now - started
+        busy = 1 - (loop.idle_time - idle_time) / elapsed if elapsed > 0 else 0
+        self.metrics.set_gauge(f"loop_{index}_utilization", round(busy, 3))
+        self.metrics.observe("loop_lag", max(0.0, now - started - SAMPLE_INTERVAL))
+        loop.call_later(SAMPLE_INTERVAL, self.sample_load, index, now, loop.idle_time)
+
+    def close(self) -> None:
+        if self.loop.in_loop_thread():
+            self.shutdown()
+        elif self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.shutdown)
+            self.closed.wait(self.options.shutdown_grace + 1)
+        else:
+            self.shutdown()
+            if not self.closed.is_set():
+                self.loop.run_forever()
+
+    def shutdown(self) -> None:
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        self.loop.remove(self.sock)
+        self.sock.close()
+        if self.stats_sock is not None:
+            self.loop.remove(self.stats_sock)
+            self.stats_sock.close()
+        self.close_transports()
+        self.loop.call_later(self.options.shutdown_grace, self.finish_shutdown)
+        self.check_shutdown()
+
+    def close_transports(self) -> None:
+        pass
+
+    def has_open_transports(self) -> bool:
+        return False
+
+    def check_shutdown(self) -> None:
+        if self.closed.is_set():
+            return
+        if self.has_open_transports():
+            self.loop.call_later(0.01, self.check_shutdown)
+        else:
+            self.finish_shutdown()
+
+    def finish_shutdown(self) -> None:
+        if self.closed.is_set():
+            return
+        self.abort_transports()
+        self.closed.set()
+        for loop in self.all_loops():
+            loop.stop()
+
+    def abort_transports(self) -> None:
+        pass
+
+
+class TCPServer(BaseServer):
+    """Accepts connections and gives each one a fresh protocol_factory() handler.
+
+    Each connection is handed to the worker loop serving the fewest. Once
+    options.max_connections are open the listening socket is no longer read,
+    so further connections wait in the kernel's listen backlog, unless
+    options.reject_when_full says to close them instead. With
+    options.evict_idle_after set, the connection that arrived when the server
+    was full is held instead, and admitted as soon as a slot frees up or a
+    long idle connection can be closed for it.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        protocol_factory: Callable[[], Protocol],
+        options: ServerOptions | None = None,
+        loop: EventLoop | None = None,
+    ) -> None:
+        options = options or ServerOptions()
+        sock = socket.socket()
+        if options.reuse_address:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((server, port))
+        sock.listen(options.backlog)
+        sock.setblocking(False)
+        super().__init__(sock, options, loop)
+        if options.workers > 1:
+            self.workers = [EventLoop() for _ in range(options.workers)]
+        self.protocol_factory = protocol_factory
+        self.transports: set[Transport] = set()
+        # Accepted rather than outbound connections, which eviction picks from.
+        self.accepted: set[Transport] = set()
+        # Only touched from the accepting loop.
+        self.connection_count = 0
+        self.worker_connections = [0] * len(self.workers)
+        self.accepting = True
+        # Connections closed to make room, until their slots are released.
+        self.evicted: set[Transport] = set()
+        # A connection accepted while full, waiting for a slot.
+        self.held: socket.socket | None = None
+        self.admit_timer: TimerHandle | None = None
+        self.loop.add_reader(self.sock, self.accept_ready)
+
+    def at_capacity(self) -> bool:
+        limit = self.options.max_connections
+        # Evicted connections are on their way out, so their slots are free.
+        return (
+            limit is not None and self.connection_count - len(self.evicted) >= limit
+        )
+
+    def accept_ready(self) -> None:
+        evicting = self.options.evict_idle_after is not None
+        # Accept a bounded batch so a flood cannot starve existing connections.
+        for _ in range(self.options.backlog):
+            full = self.at_capacity()
+            if full and not self.options.reject_when_full and not evicting:
+                self.pause_accepting()
+                return
+            try:
+                conn, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if full and not self.evict_idle():
+                if self.options.reject_when_full:
+                    self.metrics.increment("rejected")
+                    conn.close()
+                    continue
+                self.held = conn
+                self.pause_accepting()
+                if self.admit_timer is None:
+                    self.admit_timer = self.loop.call_later(
+                        EVICTION_CHECK_INTERVAL, self.admit_held
+                    )
+                return
+            self.accept_connection(conn)
+
+    def evict_idle(self) -> bool:
+        """Close the longest idle connection if it is idle enough to evict."""
+        threshold = self.options.evict_idle_after
+        if threshold is None:
+            return False
+        candidates = [
+            transport
+            for transport in list(self.accepted)
+            if transport not in self.evicted and not transport.is_closing()
+        ]
+        if not candidates:
+            return False
+        idlest = min(candidates, key=lambda transport: transport.last_activity)
+        if self.loop.time() - idlest.last_activity < threshold:
+            return False
+        self.evicted.add(idlest)
+        self.metrics.increment("evicted")
+        idlest.abort()
+        return True
+
+    def admit_held(self) -> None:
+        self.admit_timer = None
+        if self.held is None or self.shutting_down:
+            return
+        if self.at_capacity() and not self.evict_idle():
+            self.admit_timer = self.loop.call_later(
+                EVICTION_CHECK_INTERVAL, self.admit_held
+            )
+            return
+        conn, self.held = self.held, None
+        self.accept_connection(conn)
+        self.resume_accepting()
+
+    def pause_accepting(self) -> None:
+        if self.accepting:
+            self.accepting = False
+            self.loop.remove_reader(self.sock)
+            self.metrics.set_gauge("accept_paused", 1)
+            log.warning("At %d connections, no longer accepting", self.connection_count)
+
+    def resume_accepting(self) -> None:
+        if not self.accepting and not self.shutting_down:
+            self.accepting = True
+            self.loop.add_reader(self.sock, self.accept_ready)
+            self.metrics.set_gauge("accept_paused", 0)
+
+    def accept_connection(self, conn: socket.socket) -> None:
+        worker = min(range(len(self.workers)), key=self.worker_connections.__getitem__)
+        self.connection_count += 1
+        self.worker_connections[worker] += 1
+        self.record_load(worker)
+        self.metrics.increment("accepts")
+        loop = self.workers[worker]
+        if loop is self.loop:
+            self.start_transport(worker, conn)
+        else:
+            loop.call_soon_threadsafe(self.start_transport, worker, conn)
+
+    def start_transport(self, worker: int, conn: socket.socket) -> None:
+        """Set up an accepted connection. Runs on the worker's loop."""
+        if self.shutting_down:
+            conn.close()
+            self.release_connection(worker, None)
+            return
+        if self.options.nodelay:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.options.apply(conn)
+        transport = Transport(
+            self.workers[worker],
+            conn,
+            self.protocol_factory(),
+            self.options,
+            lambda transport: self.accepted_transport_closed(transport, worker),
+            self.metrics,
+        )
+        self.transport_opened(transport)
+        self.accepted.add(transport)
+        transport.start()
+
+    def accepted_transport_closed(self, transport: Transport, worker: int) -> None:
+        self.transport_closed(transport)
+        self.accepted.discard(transport)
+        if self.loop.in_loop_thread() or not self.loop.is_running():
+            self.release_connection(worker, transport)
+        else:
+            self.loop.call_soon_threadsafe(self.release_connection, worker, transport)
+
+    def release_connection(self, worker: int, transport: Transport | None) -> None:
+        self.connection_count -= 1
+        self.worker_connections[worker] -= 1
+        self.evicted.discard(transport)
+        self.record_load(worker)
+        if self.held is not None:
+            if self.at_capacity():
+                return
+            conn, self.held = self.held, None
+            self.accept_connection(conn)
+        if not self.at_capacity():
+            self.resume_accepting()
+
+    def record_load(self, worker: int) -> None:
+        self.metrics.set_gauge(
+            f"worker_{worker}_connections", self.worker_connections[worker]
+        )
+        if self.options.max_connections:
+            self.metrics.set_gauge(
+                "pool_saturation", self.connection_count / self.options.max_connections
+            )
+
+    def transport_opened(self, transport: Transport) -> None:
+        self.transports.add(transport)
+        self.metrics.increment("active_connections")
+
+    def transport_closed(self, transport: Transport) -> None:
+        self.transports.discard(transport)
+        self.metrics.increment("active_connections", -1)
+
+    def create_connection(
+        self, address: tuple[str, int], protocol: Protocol
+    ) -> Transport:
+        """Open an outbound connection driven by the accepting loop.
+
+        Outbound connections do not count towards max_connections.
+        """
+        sock = socket.socket()
+        if self.options.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.options.apply(sock)
+        transport = Transport(
+            self.loop, sock, protocol, self.options, self.transport_closed, self.metrics
+        )
+        self.transport_opened(transport)
+        transport.connect(address)
+        return transport
+
+    def close_transports(self) -> None:
+        if self.held is not None:
+            self.held.close()
+            self.held = None
+        for transport in list(self.transports):
+            transport.close()
+
+    def has_open_transports(self) -> bool:
+        return bool(self.transports)
+
+    def abort_transports(self) -> None:
+        for transport in list(self.transports):
+            transport.abort()
+
+
+class UDPServer(BaseServer):
+    """Hands every datagram to a single DatagramProtocol."""
+
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        protocol: DatagramProtocol,
+        options: ServerOptions | None = None,
+        loop: EventLoop | None = None,
+    ) -> None:
+        options = options or ServerOptions()
+        sock = socket.socket(type=socket.SOCK_DGRAM)
+        if options.reuse_address:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        options.apply(sock)
+        sock.bind((server, port))
+        super().__init__(sock, options, loop)
+        self.protocol = protocol
+        self.transport = DatagramTransport(self.loop, self.sock, options, self.metrics)
+        protocol.connection_made(self.transport)
+        self.loop.add_reader(self.sock, self.read_ready)
+
+    def read_ready(self) -> None:
+        # Drain a bounded batch of datagrams per wakeup.
+        for _ in range(self.options.backlog):
+            try:
+                data, addr = self.sock.recvfrom(self.options.recv_size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self.metrics.increment("datagrams_in")
+            self.metrics.increment("bytes_in", len(data))
+            try:
+                self.protocol.datagram_received(data, addr)
+            except Exception:
+                log.exception("Error handling datagram from %s", addr)
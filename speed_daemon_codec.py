@@ -0,0 +1,141 @@
+import struct
+from enum import IntEnum
+
+from protohackers import compact_buffer
+
+
+class MessageType(IntEnum):
+    ERROR = 0x10
+    PLATE = 0x20
+    TICKET = 0x21
+    WANTHEARTBEAT = 0x40
+    HEARTBEAT = 0x41
+    IAMCAMERA = 0x80
+    IAMDISPATCHER = 0x81
+
+
+class ProtocolError(Exception):
+    pass
+
+
+HEADER = struct.Struct(">BB")
+TIMESTAMP = struct.Struct(">I")
+WANTHEARTBEAT = struct.Struct(">BI")
+IAMCAMERA = struct.Struct(">BHHH")
+TICKET_FIELDS = struct.Struct(">HHIHIH")
+# The roads in an IAmDispatcher message, indexed by how many there are. The
+# count is a single byte, so every possible layout is compiled up front.
+ROADS = tuple(struct.Struct(f">{count}H") for count in range(256))
+
+HEARTBEAT_FRAME = bytes((MessageType.HEARTBEAT,))
+
+
+def encode_error(message: str) -> bytes:
+    encoded = message.encode("ascii")
+    return HEADER.pack(MessageType.ERROR, len(encoded)) + encoded
+
+
+BAD_MESSAGE_FRAME = encode_error("Bad Message")
+
+
+def encode_ticket(
+    plate: str,
+    road: int,
+    mile1: int,
+    timestamp1: int,
+    mile2: int,
+    timestamp2: int,
+    speed: int,
+) -> bytes:
+    encoded = plate.encode("ascii")
+    return (
+        HEADER.pack(MessageType.TICKET, len(encoded))
+        + encoded
+        + TICKET_FIELDS.pack(road, mile1, timestamp1, mile2, timestamp2, speed)
+    )
+
+
+def encode_plate(plate: str, timestamp: int) -> bytes:
+    encoded = plate.encode("ascii")
+    return (
+        HEADER.pack(MessageType.PLATE, len(encoded))
+        + encoded
+        + TIMESTAMP.pack(timestamp)
+    )
+
+
+def encode_want_heartbeat(interval: int) -> bytes:
+    return WANTHEARTBEAT.pack(MessageType.WANTHEARTBEAT, interval)
+
+
+def encode_camera(road: int, mile: int, limit: int) -> bytes:
+    return IAMCAMERA.pack(MessageType.IAMCAMERA, road, mile, limit)
+
+
+def encode_dispatcher(roads: list[int]) -> bytes:
+    return (
+        HEADER.pack(MessageType.IAMDISPATCHER, len(roads))
+        + ROADS[len(roads)].pack(*roads)
+    )
+
+
+class Decoder:
+    """Incremental decoder for client to server messages.
+
+    Received bytes are appended to a bytearray and consumed by advancing a read
+    offset. ``next_message`` returns ``None`` until a whole frame is buffered,
+    so callers can feed arbitrarily split chunks.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def feed(self, data: bytes) -> None:
+        self.offset -= compact_buffer(self.buffer, self.offset)
+        self.buffer += data
+
+    def buffered(self) -> int:
+        return len(self.buffer) - self.offset
+
+    def next_message(self) -> tuple[MessageType, object] | None:
+        buffer = self.buffer
+        offset = self.offset
+        available = len(buffer) - offset
+        if available == 0:
+            return None
+        message_type = buffer[offset]
+        if message_type == MessageType.PLATE:
+            if available < 2:
+                return None
+            plate_end = offset + 2 + buffer[offset + 1]
+            if plate_end + 4 > len(buffer):
+                return None
+            with memoryview(buffer) as view:
+                plate = str(view[offset + 2 : plate_end], "ascii")
+            (timestamp,) = TIMESTAMP.unpack_from(buffer, plate_end)
+            self.offset = plate_end + 4
+            return MessageType.PLATE, (plate, timestamp)
+        elif message_type == MessageType.WANTHEARTBEAT:
+            if available < WANTHEARTBEAT.size:
+                return None
+            _, interval = WANTHEARTBEAT.unpack_from(buffer, offset)
+            self.offset = offset + WANTHEARTBEAT.size
+            return MessageType.WANTHEARTBEAT, interval
+        elif message_type == MessageType.IAMCAMERA:
+            if available < IAMCAMERA.size:
+                return None
+            _, road, mile, limit = IAMCAMERA.unpack_from(buffer, offset)
+            self.offset = offset + IAMCAMERA.size
+            return MessageType.IAMCAMERA, (road, mile, limit)
+        elif message_type == MessageType.IAMDISPATCHER:
+            if available < 2:
+                return None
+            roads_struct = ROADS[buffer[offset + 1]]
+            frame_len = 2 + roads_struct.size
+            if available < frame_len:
+                return None
+            roads = list(roads_struct.unpack_from(buffer, offset + 2))
+            self.offset = offset + frame_len
+            return MessageType.IAMDISPATCHER, roads
+        raise ProtocolError(f"Unknown message type: {message_type:#x}")
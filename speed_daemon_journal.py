@@ -0,0 +1,282 @@
+import os
+import struct
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+# Every record starts with a one byte kind and, apart from the snapshot
+# header, a length-prefixed ASCII plate.
+PLATE_RECORD = ord("P")
+TICKET_RECORD = ord("T")
+TICKETED_RECORD = ord("D")
+SNAPSHOT_RECORD = ord("S")
+
+HEADER = struct.Struct(">BB")
+PLATE_FIELDS = struct.Struct(">IHH")
+TICKET_FIELDS = struct.Struct(">HHIHIH")
+TICKETED_FIELDS = struct.Struct(">I")
+SNAPSHOT_FIELDS = struct.Struct(">BQ")
+
+RECORD_FIELDS = {
+    PLATE_RECORD: PLATE_FIELDS,
+    TICKET_RECORD: TICKET_FIELDS,
+    TICKETED_RECORD: TICKETED_FIELDS,
+}
+
+SNAPSHOT_NAME = "snapshot"
+SECONDS_PER_DAY = 86400
+
+# Observation: (plate, timestamp, road, mile)
+# Ticket: (plate, road, mile1, timestamp1, mile2, timestamp2, speed)
+# Ticketed day: (plate, day)
+Observation = tuple[str, int, int, int]
+TicketRecord = tuple[str, int, int, int, int, int, int]
+TicketedDay = tuple[str, int]
+
+
+def encode_record(kind: int, plate: str, fields: tuple[int, ...]) -> bytes:
+    encoded = plate.encode("ascii")
+    return (
+        HEADER.pack(kind, len(encoded)) + encoded + RECORD_FIELDS[kind].pack(*fields)
+    )
+
+
+def decode_records(
+    data: bytes,
+) -> tuple[int, list[Observation], list[TicketRecord], list[TicketedDay], int]:
+    """Decode as many whole records as possible from data.
+
+    Returns the snapshot generation (0 if there is no header), the decoded
+    observations, tickets and ticketed days, and the offset just past the
+    last whole record so a torn tail can be truncated away.
+    """
+    generation = 0
+    observations: list[Observation] = []
+    tickets: list[TicketRecord] = []
+    ticketed: list[TicketedDay] = []
+    offset = 0
+    end = len(data)
+    with memoryview(data) as view:
+        while offset < end:
+            kind = data[offset]
+            if kind == SNAPSHOT_RECORD:
+                if offset + SNAPSHOT_FIELDS.size > end:
+                    break
+                _, generation = SNAPSHOT_FIELDS.unpack_from(data, offset)
+                offset += SNAPSHOT_FIELDS.size
+                continue
+            layout = RECORD_FIELDS.get(kind)
+            if layout is None or offset + 2 > end:
+                break
+            plate_end = offset + 2 + data[offset + 1]
+            if plate_end + layout.size > end:
+                break
+            plate = str(view[offset + 2 : plate_end], "ascii")
+            fields = layout.unpack_from(data, plate_end)
+            offset = plate_end + layout.size
+            if kind == PLATE_RECORD:
+                observations.append((plate, *fields))
+            elif kind == TICKET_RECORD:
+                tickets.append((plate, *fields))
+            else:
+                ticketed.append((plate, fields[0]))
+    return generation, observations, tickets, ticketed, offset
+
+
+def is_ticketed(ticket: TicketRecord, ticket_history: dict[str, set[int]]) -> bool:
+    days = ticket_history.get(ticket[0], ())
+    return (
+        ticket[3] // SECONDS_PER_DAY in days or ticket[5] // SECONDS_PER_DAY in days
+    )
+
+
+class Journal:
+    """Append-only journal of Speed Daemon state with periodic snapshots.
+
+    Records are buffered in memory and written and fsynced by a background
+    thread every sync_interval seconds, so a crash loses at most that much.
+    A snapshot of generation N covers everything logged before the journal
+    file of generation N was started, so recovery loads the snapshot and
+    replays only that one journal file. Snapshots are written by the same
+    background thread, and records appended meanwhile wait in memory for
+    the new journal file.
+    """
+
+    def __init__(self, directory: str | Path, sync_interval: float = 0.05) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sync_interval = sync_interval
+        self.generation = 0
+        self.pending = bytearray()
+        self.records_since_snapshot = 0
+        self.tickets: list[TicketRecord] = []
+        # (observations, ticket history, tickets, records appended before the
+        # snapshot was asked for) while a snapshot waits to be written.
+        self.snapshot_request: tuple | None = None
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        self.file = None
+
+    def journal_path(self, generation: int) -> Path:
+        return self.directory / f"journal-{generation:08d}"
+
+    def recover(
+        self,
+    ) -> tuple[list[Observation], list[TicketRecord], list[TicketedDay]]:
+        """Load the latest snapshot, replay its journal and start appending.
+
+        Must be called once before anything is appended.
+        """
+        snapshot_path = self.directory / SNAPSHOT_NAME
+        observations: list[Observation] = []
+        tickets: list[TicketRecord] = []
+        ticketed: list[TicketedDay] = []
+        if snapshot_path.exists():
+            snapshot = decode_records(snapshot_path.read_bytes())
+            self.generation, observations, tickets, ticketed, _ = snapshot
+        journal_path = self.journal_path(self.generation)
+        good_length = 0
+        if journal_path.exists():
+            journal = decode_records(journal_path.read_bytes())
+            observations += journal[1]
+            tickets += journal[2]
+            ticketed += journal[3]
+            good_length = journal[4]
+        for path in self.directory.glob("journal-*"):
+            if path != journal_path:
+                path.unlink()
+        self.file = open(journal_path, "ab")
+        self.file.truncate(good_length)
+        self.tickets = tickets
+        self.records_since_snapshot = len(observations) + len(tickets)
+        threading.Thread(target=self.process_pending, daemon=True).start()
+        return observations, tickets, ticketed
+
+    def append_plate(self, plate: str, timestamp: int, road: int, mile: int) -> None:
+        record = encode_record(PLATE_RECORD, plate, (timestamp, road, mile))
+        with self.lock:
+            self.pending += record
+            self.records_since_snapshot += 1
+
+    def append_ticket(self, ticket: TicketRecord) -> None:
+        record = encode_record(TICKET_RECORD, ticket[0], ticket[1:])
+        with self.lock:
+            self.pending += record
+            self.records_since_snapshot += 1
+            self.tickets.append(ticket)
+
+    def append_ticketed(self, plate: str, day: int) -> None:
+        record = encode_record(TICKETED_RECORD, plate, (day,))
+        with self.lock:
+            self.pending += record
+            self.records_since_snapshot += 1
+
+    def process_pending(self) -> None:
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self) -> None:
+        with self.file_lock:
+            with self.lock:
+                request = self.snapshot_request
+            if request is not None:
+                self.write_snapshot(*request)
+                with self.lock:
+                    self.snapshot_request = None
+            with self.lock:
+                data = self.pending
+                self.pending = bytearray()
+            if data:
+                self.file.write(data)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def start_snapshot(
+        self,
+        observations: Iterable[Observation],
+        ticket_history: dict[str, set[int]],
+    ) -> bool:
+        """Snapshot the given state in the background and start a new journal.
+
+        Cheap enough to call from the thread serving clients: everything
+        appended after this call goes to the new journal file. observations
+        and ticket_history are read later on the background thread, so the
+        caller must hand over copies it will not change. Returns False, and
+        does nothing, if the previous snapshot has not been written yet.
+        """
+        with self.lock:
+            if self.snapshot_request is not None:
+                return False
+            self.snapshot_request = (
+                observations,
+                ticket_history,
+                self.tickets,
+                self.pending,
+            )
+            self.tickets = []
+            self.pending = bytearray()
+            self.records_since_snapshot = 0
+        return True
+
+    def write_snapshot(
+        self,
+        observations: Iterable[Observation],
+        ticket_history: dict[str, set[int]],
+        tickets: list[TicketRecord],
+        previous: bytearray,
+    ) -> None:
+        """Write a compact snapshot and switch to a new, empty journal file.
+
+        previous holds the records appended before the snapshot was asked
+        for, which still belong in the old journal file. Runs with file_lock
+        held.
+        """
+        if previous:
+            self.file.write(previous)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        generation = self.generation + 1
+        tickets = [
+            ticket for ticket in tickets if not is_ticketed(ticket, ticket_history)
+        ]
+        data = bytearray(SNAPSHOT_FIELDS.pack(SNAPSHOT_RECORD, generation))
+        for plate, timestamp, road, mile in observations:
+            data += encode_record(PLATE_RECORD, plate, (timestamp, road, mile))
+        for ticket in tickets:
+            data += encode_record(TICKET_RECORD, ticket[0], ticket[1:])
+        for plate, days in ticket_history.items():
+            for day in days:
+                data += encode_record(TICKETED_RECORD, plate, (day,))
+
+        temporary_path = self.directory / f"{SNAPSHOT_NAME}.tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(data)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.directory / SNAPSHOT_NAME)
+        self.sync_directory()
+
+        self.file.close()
+        self.journal_path(self.generation).unlink()
+        self.generation = generation
+        self.file = open(self.journal_path(generation), "ab")
+        with self.lock:
+            self.tickets[:0] = tickets
+
+    def sync_directory(self) -> None:
+        try:
+            directory_fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def close(self) -> None:
+        if self.file is None:
+            return
+        self.sync()
+        self.file.close()